@@ -0,0 +1,291 @@
+"""Build benchmark: synthesize catalogs of increasing size and time generate.py on each.
+
+    python bench.py                      # 1k, 10k, 100k, 1M rows
+    python bench.py --sizes 1k,10k -j 4  # quick run, 4 render workers
+    python bench.py --slugify            # slugify() vs the old replace-loop version
+
+Each run builds a synthetic products CSV + offers.csv (cached under bench/data/),
+runs the full generate.py pipeline in a fresh process with --full --profile, and
+appends pages/s, peak RSS, output bytes and lookup query times to
+bench/results.jsonl, tagged with the current git commit so runs can be compared
+across commits.
+"""
+import csv, os, sys, json, time, random, shutil, argparse, datetime, subprocess, timeit
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+BENCH_DIR = "bench"
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+OUT_DIR = os.path.join(BENCH_DIR, "out")
+RESULTS_FILE = os.path.join(BENCH_DIR, "results.jsonl")
+
+DEFAULT_SIZES = "1k,10k,100k,1m"
+SEED = 1016
+
+# Runs one build in a fresh interpreter so peak RSS is per-size, not cumulative
+RUNNER = """
+import sys, generate as g
+(g.DATA_CSV, g.AFFILIATE_OFFERS_CSV, g.OUTPUT_DIR, g.BUILD_MANIFEST, g.SLUG_REGISTRY, g.ROWS_SNAPSHOT,
+ g.BUILD_CACHE, g.OFFERS_SNAPSHOT) = sys.argv[1:9]
+g.main(sys.argv[9:])
+"""
+
+# ----------------------------
+# Synthetic catalog
+# ----------------------------
+BRANDS = {
+    # brand: (printer lines, cartridge kinds)
+    "HP": (["DeskJet", "ENVY", "OfficeJet", "OfficeJet Pro", "LaserJet Pro", "Smart Tank"], ["Ink Cartridge", "Toner Cartridge"]),
+    "Canon": (["PIXMA", "MAXIFY", "imageCLASS", "SELPHY"], ["Ink Cartridge", "Toner Cartridge"]),
+    "Epson": (["Expression", "WorkForce", "WorkForce Pro", "EcoTank"], ["Ink Cartridge", "Ink Bottle"]),
+    "Brother": (["HL", "MFC", "DCP"], ["Toner Cartridge", "Ink Cartridge", "Drum Unit"]),
+}
+COLORS = ["Black", "Cyan", "Magenta", "Yellow", "Tri-Color", "Photo Black"]
+# Timed against each build's lookup/ index (generate.FuzzyLookup), typos included
+LOOKUP_QUERIES = ["hp envy 4520", "officejet pro 8710", "brother hl-l2350dw", "epson ecotank 2720",
+                  "canon pixma", "workfroce 3720", "tn227", "63xl black", "lc470xl", "pg245 cyan"]
+MERCHANTS = ["Amazon", "Staples", "Office Depot", "Walmart", "Best Buy", "B&H", "Newegg"]
+
+def parse_size(text):
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+def size_label(n):
+    return f"{n // 1_000_000}m" if n % 1_000_000 == 0 else (f"{n // 1_000}k" if n % 1_000 == 0 else str(n))
+
+def printer_pool(rng, brand, lines, n):
+    # a family's printers: "HP OfficeJet Pro 8710", "Brother HL-L2350DW", …
+    pool = []
+    for _ in range(n):
+        line = rng.choice(lines)
+        if brand == "Brother":
+            pool.append(f"{brand} {line}-L{rng.randint(2000, 9999)}{rng.choice(['DW', 'CDW', 'D', ''])}")
+        else:
+            pool.append(f"{brand} {line} {rng.randint(100, 9999)}{rng.choice(['', '', 'e', 'XL'])}")
+    return list(dict.fromkeys(pool))
+
+def write_catalog(path, offers_path, rows, seed=SEED):
+    """Write `rows` products + an offers.csv with 0-6 merchant offers per SKU."""
+    rng = random.Random(seed + rows)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f, \
+         open(offers_path, "w", newline="", encoding="utf-8") as fo:
+        w = csv.writer(f)
+        wo = csv.writer(fo)
+        w.writerow(["product_name", "model_number", "price", "page_yield", "compatible_models", "affiliate_url"])
+        wo.writerow(["sku", "merchant", "url", "price", "currency", "in_stock"])
+
+        family = None
+        for i in range(rows):
+            # ~every 8 rows start a new cartridge family (e.g. "HP 63" in 4 colors x XL)
+            if i % 8 == 0:
+                brand = rng.choice(list(BRANDS))
+                lines, kinds = BRANDS[brand]
+                family = {
+                    "brand": brand,
+                    "series": f"{rng.choice(['', 'T', 'TN', 'PG', 'CL', 'LC'])}{rng.randint(10, 999)}",
+                    "kind": rng.choice(kinds),
+                    # long-tail compatibility lists: most short, some very long
+                    "printers": printer_pool(rng, brand, lines, min(80, int(rng.paretovariate(1.3) * 3))),
+                }
+            xl = "XL" if rng.random() < 0.4 else ""
+            color = rng.choice(COLORS)
+            sku = f"{family['series']}{xl}{color[:2].upper()}{i:07d}"
+            page_yield = rng.choice([120, 165, 190, 300, 480, 1200, 2000, 3000]) * (2 if xl else 1)
+            price = "" if rng.random() < 0.3 else f"{rng.uniform(9, 180):.2f}"
+            k = max(1, int(len(family["printers"]) * rng.uniform(0.5, 1.0)))
+            models = "; ".join(rng.sample(family["printers"], k))
+            r = rng.random()
+            if r < 0.5:
+                aff = f"https://www.amazon.com/s?k={sku}&tag=easyproduc07b-20"
+            elif r < 0.7:
+                aff = f"https://www.amazon.com/dp/B0{rng.randrange(16**8):08X}"
+            elif r < 0.85:
+                aff = f"https://example.com/{sku.lower()}"
+            else:
+                aff = ""
+            w.writerow([f"{family['brand']} {family['series']}{xl} {color} {family['kind']}",
+                        sku, price, page_yield, models, aff])
+
+            for merchant in rng.sample(MERCHANTS, rng.choice([0, 0, 1, 2, 3, 4, 6])):
+                wo.writerow([sku, merchant, f"https://{merchant.lower().replace(' ', '')}.example/p/{sku}",
+                             f"{rng.uniform(9, 180):.2f}", "USD", rng.choice(["1", "1", "1", "0"])])
+
+def catalog_paths(rows):
+    label = size_label(rows)
+    return os.path.join(DATA_DIR, f"products-{label}.csv"), os.path.join(DATA_DIR, f"offers-{label}.csv")
+
+# ----------------------------
+# Runs + results
+# ----------------------------
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def dir_size(path):
+    total = files = 0
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(root, name))
+            files += 1
+    return total, files
+
+def run_build(rows, jobs, keep=False):
+    data_csv, offers_csv = catalog_paths(rows)
+    if not (os.path.exists(data_csv) and os.path.exists(offers_csv)):
+        print(f"  synthesizing {rows:,} rows -> {data_csv}")
+        write_catalog(data_csv, offers_csv, rows)
+
+    out = os.path.join(OUT_DIR, size_label(rows))
+    manifest = out + ".manifest.json"
+    slugs = out + ".slugs.json"
+    rows_snapshot = out + ".rows.json"
+    cache = out + ".cache.sqlite"  # removed too: every run renders cold
+    offers_snapshot = out + ".offers.snapshot"  # kept: compiled from this size's offers.csv only
+    profile = out + ".profile.json"
+    shutil.rmtree(out, ignore_errors=True)
+    for path in (manifest, slugs, rows_snapshot, cache):
+        if os.path.exists(path):
+            os.remove(path)
+
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", RUNNER, data_csv, offers_csv, out, manifest, slugs, rows_snapshot, cache,
+                    offers_snapshot, "--full", "--jobs", str(jobs), "--profile", profile, "--log-level", "WARNING"],
+                   check=True)
+    wall = time.perf_counter() - t0
+
+    with open(profile, encoding="utf-8") as f:
+        report = json.load(f)
+    out_bytes, out_files = dir_size(out)
+    rss = report.get("peak_rss_kb") or {}
+    pages = report["pages"]["pages"]
+    result = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows": rows,
+        "pages": pages,
+        "jobs": jobs,
+        "seconds": round(wall, 3),
+        "build_seconds": report["total_seconds"],
+        "pages_per_s": round(pages / wall, 1) if wall else None,
+        "peak_rss_kb": rss.get("self"),
+        "worker_peak_rss_kb": rss.get("workers"),
+        "output_bytes": out_bytes,
+        "output_files": out_files,
+        "stages": {name: st["seconds"] for name, st in report["stages"].items()},
+        "lookup": bench_lookup(out),
+    }
+    if not keep:
+        shutil.rmtree(out, ignore_errors=True)
+    return result
+
+def bench_lookup(out):
+    """Median / worst ms per FuzzyLookup.search over LOOKUP_QUERIES, index already loaded."""
+    from generate import FuzzyLookup, LOOKUP_DIR
+    path = os.path.join(out, LOOKUP_DIR)
+    t0 = time.perf_counter()
+    lookup = FuzzyLookup(path)
+    load_ms = (time.perf_counter() - t0) * 1000
+    times = []
+    for query in LOOKUP_QUERIES:
+        t0 = time.perf_counter()
+        lookup.search(query)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return {"load_ms": round(load_ms, 1), "median_ms": round(times[len(times) // 2], 2),
+            "max_ms": round(times[-1], 2), "index_bytes": dir_size(path)[0]}
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def previous_result(history, result):
+    # latest earlier run of the same size/jobs from a different commit
+    for old in reversed(history):
+        if old["rows"] == result["rows"] and old["jobs"] == result["jobs"] and old["commit"] != result["commit"]:
+            return old
+    return None
+
+def delta(new, old):
+    if not old or not new:
+        return ""
+    return f" ({(new - old) / old:+.0%})"
+
+# ----------------------------
+# slugify micro-benchmark
+# ----------------------------
+
+def legacy_slugify(text):
+    # generate.slugify() before the translate-table rewrite, kept as the reference
+    allowed = "abcdefghijklmnopqrstuvwxyz0123456789-"
+    text = (text or "").strip().lower()
+    for ch in [" ", "_", "/", ".", ",", "|", "—", "–", "(", ")", "[", "]", "&", "+", "#", "'", '"', ":"]:
+        text = text.replace(ch, "-")
+    while "--" in text:
+        text = text.replace("--", "-")
+    text = "".join(ch for ch in text if ch in allowed)
+    return text.strip("-") or "item"
+
+def bench_slugify(rows=100_000):
+    from generate import slugify
+    data_csv, offers_csv = catalog_paths(rows)
+    if not os.path.exists(data_csv):
+        write_catalog(data_csv, offers_csv, rows)
+    with open(data_csv, newline="", encoding="utf-8") as f:
+        texts = [t for row in csv.DictReader(f) for t in (row["product_name"], row["model_number"])]
+    texts += ["", "  ", "a--b", "a-é-b", "Ünïcödé – (Test) [x] & y + #1: 'q' \"z\"", "--lead|trail--",
+              "a-!-b", "a\tb", "A_B__C", "\u212a", "\u0130x"]  # dropped after collapsing; lower() to ASCII
+
+    mismatches = [t for t in texts if slugify(t) != legacy_slugify(t)]
+    old = min(timeit.repeat(lambda: [legacy_slugify(t) for t in texts], number=1, repeat=3))
+    new = min(timeit.repeat(lambda: [slugify(t) for t in texts], number=1, repeat=3))
+    print(f"[bench] slugify over {len(texts):,} strings: legacy {old:.3f}s · current {new:.3f}s "
+          f"({old / new:.1f}x) · {len(mismatches)} mismatches")
+    for t in mismatches[:10]:
+        print(f"  {t!r}: legacy={legacy_slugify(t)!r} current={slugify(t)!r}")
+    return not mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark generate.py on synthetic catalogs")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated row counts (default: {DEFAULT_SIZES})")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="generate.py --jobs (default: 1)")
+    parser.add_argument("--keep", action="store_true", help=f"keep the generated sites under {OUT_DIR}/")
+    parser.add_argument("--no-save", action="store_true", help=f"don't append to {RESULTS_FILE}")
+    parser.add_argument("--slugify", action="store_true", help="only run the slugify() micro-benchmark")
+    args = parser.parse_args(argv)
+
+    # generate.py resolves data/ and templates/ relative to the repo root
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.slugify:
+        sys.exit(0 if bench_slugify() else 1)
+    history = load_results(RESULTS_FILE)
+
+    for rows in (parse_size(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"[bench] {size_label(rows)} rows, jobs={args.jobs}")
+        result = run_build(rows, args.jobs, keep=args.keep)
+        old = previous_result(history, result)
+        print(f"  {result['pages_per_s']:,} pages/s{delta(result['pages_per_s'], old and old['pages_per_s'])} · "
+              f"{result['seconds']}s · peak RSS {result['peak_rss_kb']:,} KB{delta(result['peak_rss_kb'], old and old['peak_rss_kb'])} · "
+              f"{result['output_bytes']:,} bytes in {result['output_files']:,} files"
+              + (f" · vs {old['commit']}" if old else ""))
+        lookup = result["lookup"]
+        print(f"  lookup: {lookup['median_ms']} ms median, {lookup['max_ms']} ms max per query · "
+              f"{lookup['load_ms']} ms load · {lookup['index_bytes']:,} byte index")
+        if not args.no_save:
+            os.makedirs(BENCH_DIR, exist_ok=True)
+            with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, sort_keys=True) + "\n")
+        history.append(result)
+
+if __name__ == "__main__":
+    main()
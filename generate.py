@@ -1,5 +1,14 @@
-import csv, os, math, datetime, urllib.parse
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import csv, io, os, re, sys, bisect, functools, threading, shutil, math, time, datetime, urllib.parse, hashlib, json, argparse, itertools, collections, heapq, gzip, glob, tempfile, filecmp, logging, mmap, sqlite3, struct, zlib
+from array import array
+from xml.sax.saxutils import escape as xml_escape
+from html import unescape as html_unescape
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+try:
+    import brotli  # optional: .br siblings for --precompress
+except ImportError:
+    brotli = None
 
 # ----------------------------
 # CONFIG — adjust these first
@@ -14,9 +23,22 @@ OUTPUT_DIR = "docs"
 DATA_CSV = "data/products.csv"
 # optional multi-merchant offer file (can omit)
 AFFILIATE_OFFERS_CSV = "data/offers.csv"
+# compiled, memory-mapped copy of offers.csv; rebuilt whenever offers.csv changes
+OFFERS_SNAPSHOT = ".offers.snapshot"
 
 TEMPLATE_DIR = "templates"
 TEMPLATE_FILE = "page_template.html"
+# Page parts that are the same on every page, rendered once per build
+FRAGMENT_CSS = "partials/page.css"
+FRAGMENT_TOPBAR = "partials/page_topbar.html"
+# Link one content-hashed ASSETS_DIR/site-<hash>.css instead of inlining the CSS in every page
+EXTERNAL_CSS = False
+ASSETS_DIR = "assets"
+# Section index (/cartridges/, /cartridges/page/N/) and homepage templates
+SECTION_TEMPLATE_FILE = "section_template.html"
+HOME_TEMPLATE_FILE = "home_template.html"
+# Compiled template bytecode, reused across builds (None = compile every run)
+TEMPLATE_CACHE_DIR = ".jinja-cache"
 PRICE_CURRENCY = "USD"
 
 # Your Amazon Associates tracking ID
@@ -25,258 +47,298 @@ AFFILIATE_AMAZON_TAG = "easyproduc07b-20"
 # URL structure for part pages (toner/ink are "cartridges")
 SECTION = "cartridges"  # change later per-vertical if needed
 
+# Several catalogs in one build, each {"section", "csv", "template"}; the first one is the
+# main nav section. None = the single SECTION / DATA_CSV / TEMPLATE_FILE catalog, e.g.
+# CATALOGS = [
+#     {"section": "cartridges", "csv": "data/products.csv", "template": "page_template.html"},
+#     {"section": "ink", "csv": "data/printer_cartridges.csv", "template": "page_template.html"},
+# ]
+CATALOGS = None
+
+# Printer pages (/printers/<slug>/) built from the compatible_models reverse index
+PRINTER_SECTION = "printers"
+PRINTER_TEMPLATE_FILE = "printer_template.html"
+RELATED_PARTS_LIMIT = 8
+
 # Optional limit while testing (None = all)
 ROW_LIMIT = None
 
+# Incremental builds: per-slug content hashes from the last run (kept next to OUTPUT_DIR)
+BUILD_MANIFEST = ".build-manifest.json"
+# SKU -> slug assignments, so disambiguated slugs keep their URL across builds
+SLUG_REGISTRY = ".slug-registry.json"
+# Rendered pages by input digest, reused across builds and read by --check (None = off)
+BUILD_CACHE = ".build-cache.sqlite"
+BUILD_CACHE_MAX_BYTES = 512 * 1024 * 1024  # compressed page bytes kept; least recently used go first
+
+# Section index: cards per page, and prefix length used to shard the search JSON
+SECTION_PAGE_SIZE = 48
+SEARCH_PREFIX_LEN = 2
+SEARCH_MAX_RESULTS = 60
+SEARCH_SHARD_MAX_IDS = 2000   # a prefix shard listing more page ids is split one character further
+SEARCH_TITLE_BLOCK = 256      # titles per search/_titles-N.json block
+# words too common to narrow a search: not indexed, and dropped from queries
+SEARCH_STOP_WORDS = ("cartridge", "cartridges", "ink", "toner", "black")
+SEARCH_STOP_DF = 0.5          # ... and any word on more than this share of a section's pages
+
+# Sitemap protocol limits per file; shards roll over at whichever is hit first
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_GZIP = False  # write sitemap-N.xml.gz instead of sitemap-N.xml
+
+# Fuzzy printer/cartridge lookup: trigram index in OUTPUT_DIR/lookup/, queried by the
+# homepage search box (templates/partials/lookup.js) and by FuzzyLookup / --lookup
+LOOKUP_DIR = "lookup"
+LOOKUP_SHARDS = 512       # postings files; a query fetches one per distinct trigram bucket
+LOOKUP_BLOCK = 64         # docs per d-N.json name/path block
+LOOKUP_TOP_K = 10
+LOOKUP_PRINTERS = 20      # best-matching printers whose cartridges are ranked
+LOOKUP_MIN_SCORE = 0.25
+LOOKUP_LENGTH_WEIGHT = 0.25  # 1 = Jaccard; lower lets a short query match a long title
+LOOKUP_STOP_DF = 0.1         # trigrams in more printers (or cartridges) than this, and than
+LOOKUP_STOP_MIN_DOCS = 500   # LOOKUP_STOP_MIN_DOCS, aren't indexed for that kind: " hp", "ink"
+
+# Post-render: minify HTML as it is written, then add .gz/.br siblings for changed files
+MINIFY_HTML = False
+PRECOMPRESS = False
+PRECOMPRESS_EXTENSIONS = (".html", ".xml", ".txt", ".json", ".css", ".js", ".bin")  # .bin: lookup postings
+PRECOMPRESS_MIN_BYTES = 256  # smaller files aren't worth a sibling
+PRECOMPRESS_THREADS = min(32, (os.cpu_count() or 1) + 4)  # zlib/brotli release the GIL
+
+# Validation pass before rendering: required columns, plausible cost per page, and the
+# per-row content hashes of the last build (for --validate row diffs)
+REQUIRED_COLUMNS = ("product_name", "model_number", "price", "page_yield", "compatible_models")
+CPP_RANGE = (0.001, 0.50)  # cost per page outside this (in PRICE_CURRENCY) is flagged as an outlier
+ROWS_SNAPSHOT = ".rows-snapshot.json"
+VALIDATE_SAMPLES = 10      # example rows listed per issue kind / diff bucket
+
+# --verify: after the build, resolve every internal link, canonical, JSON-LD URL and
+# sitemap entry against the files in OUTPUT_DIR, and flag pages nothing links to
+VERIFY_THREADS = min(32, (os.cpu_count() or 1) + 4)  # page reads release the GIL
+VERIFY_CHUNK = 256         # pages per thread-pool task
+
+# --profile: JSON report of per-stage timings, peak memory and the slowest pages
+PROFILE_REPORT = "build-profile.json"
+PROFILE_TOP_N = 20
+
+log = logging.getLogger("generate")
+
 # ----------------------------
-# Utilities
+# Site: the settings + state a build runs on
 # ----------------------------
 
-# ----------  SECTION + HOME INDEX HELPERS  ----------
-PAGES_BY_SECTION = {}              # { "cartridges": [ (slug, title) , … ] }
-
-def build_section_index(section: str) -> None:
-    """Section page with top bar, gradient hero, live product search, theme toggle."""
-    items = PAGES_BY_SECTION.get(section, [])
-    cards_html = "\n".join(
-        f"""
-        <a class='card' data-title='{title.lower()}' href='{BASE_URL}/{section}/{slug}/'>
-          <h3>{title}</h3>
-          <p>Details →</p>
-        </a>"""
-        for slug, title in sorted(items, key=lambda x: x[1].lower())
-    )
-
-    html = f"""<!doctype html>
-<html lang="en" data-theme="auto">
-<head>
-  <meta charset="utf-8" />
-  <meta name="viewport" content="width=device-width,initial-scale=1" />
-  <title>{section.capitalize()} – {SITE_NAME}</title>
-  <link rel="canonical" href="{BASE_URL}/{section}/" />
-  <style>
-    :root{{
-      --bg:#0b1020; --surface:#0f1428; --card:#ffffff; --ink:#0b1220; --muted:#687089;
-      --b:#e7e8ef; --accent:#3b82f6; --accent-2:#1d4ed8; --chip:#f2f5ff;
-      --max:1200px; --pad:18px; --radius:16px; --shadow:0 8px 30px rgba(10,20,30,.08);
-    }}
-    html[data-theme="dark"] :root, :root[data-theme="dark"]{{ 
-      --card:#0f172a; --ink:#e5e7ef; --b:#1f2937; --chip:#111827;
-    }}
-    @media (prefers-color-scheme: dark) {{
-      html[data-theme="auto"] :root{{ --card:#0f172a; --ink:#e5e7ef; --b:#1f2937; --chip:#111827; }}
-      html[data-theme="auto"] body{{ background:#0b1020; }}
-    }}
-    *{{box-sizing:border-box}} html,body{{margin:0}}
-    body{{font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,"Helvetica Neue",Arial;
-         line-height:1.6; background:var(--bg); color:var(--ink)}}
-
-    .topbar{{background:linear-gradient(180deg, var(--surface), rgba(15,23,42,.6)); color:#fff}}
-    .topbar .wrap{{max-width:var(--max); margin:0 auto; padding:14px var(--pad);
-                   display:flex; align-items:center; gap:14px; justify-content:space-between}}
-    .brand{{display:flex; align-items:center; gap:10px; text-decoration:none; color:#fff; font-weight:800}}
-    .logo{{width:28px;height:28px;border-radius:10px;background:linear-gradient(135deg,#60a5fa,#a78bfa);
-           box-shadow:inset 0 0 0 2px rgba(255,255,255,.2)}}
-    .nav a{{color:#cbd5e1;text-decoration:none;font-weight:600;margin-left:14px}}
-    .nav a:hover{{color:#fff}}
-    .theme-btn{{appearance:none;border:1px solid rgba(255,255,255,.25);background:transparent;color:#fff;
-                padding:8px 10px;border-radius:10px;cursor:pointer;font-weight:700}}
-
-    .hero{{background:
-      radial-gradient(1200px 400px at 20% -10%, rgba(59,130,246,.35), transparent 60%),
-      radial-gradient(900px 300px at 90% -20%, rgba(167,139,250,.28), transparent 60%),
-      linear-gradient(180deg, rgba(15,23,42,.9), rgba(15,23,42,.66)); color:#fff; border-bottom:1px solid rgba(255,255,255,.06)}}
-    .hero .wrap{{max-width:var(--max); margin:0 auto; padding:28px var(--pad) 34px}}
-    .breadcrumbs{{font-size:13px; color:#94a3b8; margin-bottom:8px}}
-    .breadcrumbs a{{color:inherit; text-decoration:none}}
-    h1{{font-size:clamp(24px,5vw,36px); margin:8px 0 0}}
-
-    .wrap{{max-width:var(--max); margin:0 auto; padding:32px 20px}}
-    .search{{max-width:520px; margin:18px 0 28px; display:flex}}
-    .search input{{flex:1;padding:12px 14px;border:1px solid var(--b);border-radius:12px;font-size:16px;background:var(--card);color:var(--ink)}}
-    .grid{{display:grid;grid-template-columns:repeat(auto-fill,minmax(220px,1fr));gap:24px}}
-    .card{{border:1px solid var(--b);border-radius:16px;padding:22px 18px;text-decoration:none;color:var(--ink);
-           background:var(--card);transition:all .15s; box-shadow:var(--shadow)}}
-    .card:hover{{transform:translateY(-2px); box-shadow:0 10px 28px rgba(0,0,0,.10)}}
-    .card h3{{margin:0 0 6px;font-size:18px}}
-    .card p{{margin:0;color:var(--muted);font-size:14px}}
-    footer{{margin-top:24px;text-align:center;color:#94a3b8;font-size:13px}}
-  </style>
-</head>
-<body>
-  <div class="topbar">
-    <div class="wrap">
-      <a class="brand" href="{BASE_URL}/"><div class="logo"></div><span>{SITE_NAME}</span></a>
-      <div class="nav">
-        <a href="{BASE_URL}/{section}/">{section.capitalize()}</a>
-        <button id="themeToggle" class="theme-btn" type="button">Toggle theme</button>
-      </div>
-    </div>
-  </div>
-
-  <div class="hero">
-    <div class="wrap">
-      <div class="breadcrumbs"><a href="{BASE_URL}/">Home</a> › <a href="{BASE_URL}/{section}/">{section.capitalize()}</a></div>
-      <h1>{section.capitalize()}</h1>
-    </div>
-  </div>
-
-  <div class="wrap">
-    <div class="search"><input id="itemSearch" type="search" placeholder="Search {section}…" aria-label="Search {section}"></div>
-    <section id="itemGrid" class="grid">{cards_html}</section>
-    <footer>{len(items)} items · Last updated {today_iso()}</footer>
-  </div>
-
-  <script>
-    // Live filter
-    const search = document.getElementById('itemSearch');
-    const cards  = Array.from(document.querySelectorAll('#itemGrid .card'));
-    search?.addEventListener('input', e => {{
-      const v = e.target.value.trim().toLowerCase();
-      cards.forEach(c => {{
-        const title = c.dataset.title || '';
-        c.style.display = title.includes(v) ? '' : 'none';
-      }});
-    }});
-
-    // Theme toggle (persists)
-    const root = document.documentElement;
-    const key = 'theme-pref';
-    function applyTheme(t) {{ root.setAttribute('data-theme', t); }}
-    const saved = localStorage.getItem(key);
-    if (saved) applyTheme(saved);
-    document.getElementById('themeToggle').addEventListener('click', () => {{
-      const cur = root.getAttribute('data-theme') || 'auto';
-      const next = cur === 'dark' ? 'light' : (cur === 'light' ? 'auto' : 'dark');
-      localStorage.setItem(key, next); applyTheme(next);
-    }});
-  </script>
-</body></html>"""
-    write_text(os.path.join(OUTPUT_DIR, section, "index.html"), html)
+def default_settings():
+    """The module's UPPER_CASE settings -> {name: value}; the CLI's, and every Site's defaults."""
+    return {name: value for name, value in globals().items() if name.isupper() and not name.startswith("_")}
+
+class Site:
+    """One site's settings and build state, passed as `site` to every build step.
+
+    Settings are the UPPER_CASE names above, as attributes (site.OUTPUT_DIR, …):
+    default_settings() overridden by `config`. The rest is state, lowercase. Builds
+    reset the per-build part (reset_build_state); the offers store, Jinja environment
+    and parsed rows stay warm for the next build. Nothing is shared between sites or
+    kept in module globals, so different sites can build at the same time in threads.
+    """
+
+    def __init__(self, **config):
+        settings = default_settings()
+        unknown = [name for name in config if name not in settings]
+        if unknown:
+            raise TypeError(f"unknown setting(s): {', '.join(unknown)}")
+        settings.update(config)
+        vars(self).update(settings)
+        self.pages_by_section = {}    # { "cartridges": [ (slug, title, url) , … ] }
+        self.search_index = {}        # { "cartridges": { token: array("I") of search ids } } (SlugRegistry.ids())
+        self.section_rendered = {}    # { "cartridges": {n: signature} } index pages written this build (see --watch)
+        self.printer_index = {}       # { printer slug: {"name": display name, "pages": [(section, slug), …]} }
+        # files/bytes actually written (unchanged files are not touched); html_in/html_out
+        # are the HTML sizes before/after minification
+        self.write_stats = {"written": 0, "unchanged": 0, "bytes": 0, "html_in": 0, "html_out": 0}
+        self.profile = None           # { stage: [calls, seconds] } while profiling, else None
+        self.slowest_pages = []       # min-heap of (seconds, slug), PROFILE_TOP_N long
+        self.offers_by_sku = OffersStore()
+        self.page_fragments = {}      # {"styles": Markup, "topbar": Markup}, passed to the page template as `fragments`
+        self.env = None               # one Environment per site: templates compile (or load from the cache) once
+        self.page_templates = {}      # compiled page templates by file name
+        self.row_cache = {}           # csv path -> ((mtime_ns, size), [rows]) (cached_rows)
+
+    def settings(self):
+        """This site's settings (no state) -> {name: value}, e.g. for worker processes."""
+        return {name: value for name, value in vars(self).items() if name.isupper()}
 
+# ----------------------------
+# Utilities
+# ----------------------------
 
-def build_homepage_full() -> None:
+# ----------  SECTION + HOME INDEX HELPERS  ----------
+def search_tokens(row):
+    """Lowercase alnum words (2+ chars) from title, model number and compatible printers."""
+    model_number = (row.get("model_number") or "").lower()
+    words = re.findall(r"[a-z0-9]+", " ".join([
+        (row.get("product_name") or "").lower(), model_number,
+        " ".join(parse_compatible_models(row.get("compatible_models"))).lower(),
+    ]))
+    tokens = {w for w in words if len(w) >= 2}
+    # "TN-227BK" should also match "tn227"
+    tokens.add("".join(re.findall(r"[a-z0-9]+", model_number)))
+    tokens.discard("")
+    return tokens
+
+def index_search_tokens(site, section, page_id, row):
+    # u32 arrays, not sets of slugs: a set costs 216+ bytes even for the one page most tokens have
+    index = site.search_index.setdefault(section, {})
+    for token in search_tokens(row):
+        ids = index.get(token)
+        if ids is None:
+            index[token] = array("I", (page_id,))
+        else:
+            ids.append(page_id)
+
+def unindex_search_tokens(site, section, page_id, row):
+    index = site.search_index.get(section, {})
+    for token in search_tokens(row):
+        ids = index.get(token)
+        if ids is not None and page_id in ids:
+            ids.remove(page_id)
+            if not ids:
+                del index[token]
+
+def section_page_url(site, section, n):
+    return f"{site.BASE_URL}/{section}/" if n == 1 else f"{site.BASE_URL}/{section}/page/{n}/"
+
+def section_page_path(site, section, n):
+    if n == 1:
+        return os.path.join(site.OUTPUT_DIR, section, "index.html")
+    return os.path.join(site.OUTPUT_DIR, section, "page", str(n), "index.html")
+
+def build_search_index(site, section, items, ids):
+    """Write the live-search files under {section}/search/ for `items` [(slug, title, url)].
+
+    Pages are numbered by `ids` ({slug: id}, SlugRegistry.ids(), as in site.search_index): stable,
+    so adding or removing a page only rewrites the shards and title block it is in. Titles sit in _titles-N.json blocks of SEARCH_TITLE_BLOCK
+    [slug, title] pairs by id (null for ids no longer in use); the client fetches the
+    titles it shows and sorts them. <prefix>.json shards map the tokens starting
+    with <prefix> to page ids; a shard over SEARCH_SHARD_MAX_IDS ids is split into
+    one-character-longer prefixes (tokens as long as the prefix stay put). Stop words
+    aren't indexed. _meta.json lists the stop words and the split prefixes.
+    """
+    index = site.search_index.get(section, {})
+    max_df = site.SEARCH_STOP_DF * len(items)
+    stop = sorted(t for t, page_ids in index.items() if t in site.SEARCH_STOP_WORDS or len(page_ids) > max_df)
+    tokens = {t: sorted(page_ids) for t, page_ids in index.items() if t not in stop}
+
+    # group tokens by prefix, splitting hot prefixes until every shard fits (or is one token)
+    shards, split = {}, {}
+    pending = {}
+    for token in tokens:
+        pending.setdefault(token[:site.SEARCH_PREFIX_LEN], []).append(token)
+    while pending:
+        key, group = pending.popitem()
+        longer = [t for t in group if len(t) > len(key)]
+        children = {}
+        for token in longer:
+            children.setdefault(token[:len(key) + 1], []).append(token)
+        # splitting one word off by itself ("br" -> "bro" -> … "brother") saves nothing
+        if sum(len(tokens[t]) for t in group) > site.SEARCH_SHARD_MAX_IDS and \
+                len(children) + (len(longer) < len(group)) > 1:
+            split[key] = sorted(children)
+            pending.update(children)
+            group = [t for t in group if len(t) == len(key)]
+            if not group:
+                continue
+        shards[key] = {t: tokens[t] for t in sorted(group)}
+
+    out_dir = os.path.join(site.OUTPUT_DIR, section, "search")
+    files = {f"{key}.json": shard for key, shard in shards.items()}
+    blocks = {}
+    for slug, title, _url in items:
+        i = ids[slug]
+        block = blocks.setdefault(i // site.SEARCH_TITLE_BLOCK, [None] * site.SEARCH_TITLE_BLOCK)
+        block[i % site.SEARCH_TITLE_BLOCK] = [slug, title]
+    for n, block in blocks.items():
+        while block[-1] is None:
+            block.pop()
+        files[f"_titles-{n}.json"] = block
+    files["_meta.json"] = {"stop": stop, "split": dict(sorted(split.items())),
+                           "prefix": site.SEARCH_PREFIX_LEN, "block": site.SEARCH_TITLE_BLOCK}
+    for name, data in files.items():
+        write_text(site, os.path.join(out_dir, name), json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    for path in glob.glob(os.path.join(out_dir, "*.json")):
+        if os.path.basename(path) not in files:
+            remove_output(path)
+
+def build_section_index(site, section: str, page_size: int = None, lastmods: dict = None,
+                        rendered: dict = None, search: bool = True, ids: dict = None) -> None:
+    """Paginated section pages with top bar, gradient hero, sharded live search, theme toggle.
+
+    `lastmods` is {url: lastmod}; each page's footer date is the newest lastmod among the
+    cards on it (today when unknown), so index pages only change along with their cards.
+    `rendered` ({n: (cards, date, pages, total)} of the pages written last time, kept by --watch)
+    skips the pages whose cards and date are unchanged, and is updated in place.
+    `search=False` leaves the search files alone; searching needs `ids`, the section's
+    SlugRegistry.ids().
+    """
+    lastmods = lastmods or {}
+    items = sorted(site.pages_by_section.get(section, []), key=lambda x: x[1].lower())
+    page_size = page_size or site.SECTION_PAGE_SIZE
+    pages = max(1, math.ceil(len(items) / page_size))
+
+    tpl = get_env(site).get_template(site.SECTION_TEMPLATE_FILE)
+    nav_sections = [c["section"] for c in catalog_list(site)]
+    for n in range(1, pages + 1):
+        chunk = items[(n - 1) * page_size:n * page_size]
+        last_updated = max((lastmods.get(url, "") for _slug, _title, url in chunk), default="")
+        if rendered is not None:
+            signature = (chunk, last_updated, pages, len(items))
+            if rendered.get(n) == signature and os.path.exists(section_page_path(site, section, n)):
+                continue
+            rendered[n] = signature
+        write_stream(site, section_page_path(site, section, n), tpl.generate(
+            site_name=site.SITE_NAME,
+            base_url=site.BASE_URL,
+            nav_sections=nav_sections,
+            printer_section=site.PRINTER_SECTION,
+            section=section,
+            n=n,
+            pages=pages,
+            total=len(items),
+            page_label=f" – Page {n}" if n > 1 else "",
+            canonical_url=section_page_url(site, section, n),
+            prev_url=section_page_url(site, section, n - 1) if n > 1 else None,
+            next_url=section_page_url(site, section, n + 1) if n < pages else None,
+            cards=((title, url) for _slug, title, url in chunk),
+            last_updated=last_updated or today_iso(),
+            search_max_results=site.SEARCH_MAX_RESULTS,
+        ))
+
+    # drop pagination pages left over from a bigger catalog
+    for path in glob.glob(os.path.join(site.OUTPUT_DIR, section, "page", "*", "index.html")):
+        n = os.path.basename(os.path.dirname(path))
+        if not n.isdigit() or not 1 < int(n) <= pages:
+            remove_output(path)
+            os.rmdir(os.path.dirname(path))
+    if rendered is not None:
+        for n in [n for n in rendered if n > pages]:
+            del rendered[n]
+
+    if search:
+        build_search_index(site, section, items, ids)
+
+def build_homepage_full(site, last_updated: str = None) -> None:
     """Home page with top bar, gradient hero, live category search, theme toggle."""
-    # category cards
-    cards_html = "\n".join(
-        f"""
-        <a class="card" data-name="{sec.lower()}" href="{BASE_URL}/{sec}/">
-          <h3>{sec.capitalize()}</h3>
-          <p>{len(items)} items →</p>
-        </a>
-        """
-        for sec, items in sorted(PAGES_BY_SECTION.items())
-    )
-
-    html = f"""<!doctype html>
-<html lang="en" data-theme="auto">
-<head>
-  <meta charset="utf-8">
-  <meta name="viewport" content="width=device-width,initial-scale=1">
-  <title>{SITE_NAME}</title>
-  <link rel="canonical" href="{BASE_URL}/">
-  <style>
-    :root{{
-      --bg:#0b1020; --surface:#0f1428; --card:#ffffff; --ink:#0b1220; --muted:#687089;
-      --b:#e7e8ef; --accent:#3b82f6; --accent-2:#1d4ed8; --chip:#f2f5ff;
-      --max:1200px; --pad:18px; --radius:16px; --shadow:0 8px 30px rgba(10,20,30,.08);
-    }}
-    /* Dark theme vars (preferred if data-theme=dark) */
-    html[data-theme="dark"] :root, :root[data-theme="dark"]{{ 
-      --card:#0f172a; --ink:#e5e7ef; --b:#1f2937; --chip:#111827;
-    }}
-    /* Fallback to OS preference if user hasn't chosen */
-    @media (prefers-color-scheme: dark) {{
-      html[data-theme="auto"] :root{{ --card:#0f172a; --ink:#e5e7ef; --b:#1f2937; --chip:#111827; }}
-      html[data-theme="auto"] body{{ background:#0b1020; }}
-    }}
-    *{{box-sizing:border-box}} html,body{{margin:0}}
-    body{{font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,"Helvetica Neue",Arial;
-         line-height:1.6; background:var(--bg); color:var(--ink)}}
-
-    /* Topbar */
-    .topbar{{background:linear-gradient(180deg, var(--surface), rgba(15,23,42,.6)); color:#fff}}
-    .topbar .wrap{{max-width:var(--max); margin:0 auto; padding:14px var(--pad);
-                   display:flex; align-items:center; gap:14px; justify-content:space-between}}
-    .brand{{display:flex; align-items:center; gap:10px; text-decoration:none; color:#fff; font-weight:800}}
-    .logo{{width:28px;height:28px;border-radius:10px;background:linear-gradient(135deg,#60a5fa,#a78bfa);
-           box-shadow:inset 0 0 0 2px rgba(255,255,255,.2)}}
-    .nav a{{color:#cbd5e1;text-decoration:none;font-weight:600;margin-left:14px}}
-    .nav a:hover{{color:#fff}}
-    .theme-btn{{appearance:none;border:1px solid rgba(255,255,255,.25);background:transparent;color:#fff;
-                padding:8px 10px;border-radius:10px;cursor:pointer;font-weight:700}}
-
-    /* Hero */
-    .hero{{background:
-      radial-gradient(1200px 400px at 20% -10%, rgba(59,130,246,.35), transparent 60%),
-      radial-gradient(900px 300px at 90% -20%, rgba(167,139,250,.28), transparent 60%),
-      linear-gradient(180deg, rgba(15,23,42,.9), rgba(15,23,42,.66)); color:#fff; border-bottom:1px solid rgba(255,255,255,.06)}}
-    .hero .wrap{{max-width:var(--max); margin:0 auto; padding:28px var(--pad) 34px; text-align:center}}
-    .hero h1{{font-size:clamp(28px,6vw,44px); margin:0 0 8px}}
-    .hero p{{color:#cbd5e1; margin:0}}
-
-    /* Search + grid */
-    .wrap{{max-width:var(--max); margin:0 auto; padding:32px 20px}}
-    .search{{max-width:460px; margin:22px auto 28px; display:flex}}
-    .search input{{flex:1;padding:12px 14px;border:1px solid var(--b);border-radius:12px;font-size:16px;background:var(--card);color:var(--ink)}}
-    .grid{{display:grid;grid-template-columns:repeat(auto-fill,minmax(220px,1fr));gap:24px}}
-    .card{{border:1px solid var(--b);border-radius:16px;padding:22px 18px;text-decoration:none;color:var(--ink);
-           background:var(--card);transition:all .15s; box-shadow:var(--shadow)}}
-    .card:hover{{transform:translateY(-2px); box-shadow:0 10px 28px rgba(0,0,0,.10)}}
-    .card h3{{margin:0 0 6px;font-size:20px}}
-    .card p{{margin:0;color:var(--muted)}}
-    footer{{margin-top:24px;text-align:center;color:#94a3b8;font-size:13px}}
-  </style>
-</head>
-<body>
-  <div class="topbar">
-    <div class="wrap">
-      <a class="brand" href="{BASE_URL}/"><div class="logo"></div><span>{SITE_NAME}</span></a>
-      <div class="nav">
-        <a href="{BASE_URL}/cartridges/">Cartridges</a>
-        <button id="themeToggle" class="theme-btn" type="button">Toggle theme</button>
-      </div>
-    </div>
-  </div>
-
-  <div class="hero">
-    <div class="wrap">
-      <h1>{SITE_NAME}</h1>
-      <p>Your quick-lookup index for replacement parts & specs.</p>
-    </div>
-  </div>
-
-  <div class="wrap">
-    <div class="search"><input id="catSearch" type="search" placeholder="Search categories…" aria-label="Search categories"></div>
-    <section id="catGrid" class="grid">{cards_html}</section>
-    <footer>Last updated {today_iso()} · <a href="{BASE_URL}/sitemap.xml" style="color:inherit">Sitemap</a></footer>
-  </div>
-
-  <script>
-    // Live filter
-    const q = document.getElementById('catSearch');
-    const cards = Array.from(document.querySelectorAll('#catGrid .card'));
-    q?.addEventListener('input', e => {{
-      const v = e.target.value.trim().toLowerCase();
-      cards.forEach(c => c.style.display = c.dataset.name.includes(v) ? '' : 'none');
-    }});
-
-    // Theme toggle (persists)
-    const root = document.documentElement;
-    const key = 'theme-pref';
-    function applyTheme(t) {{
-      root.setAttribute('data-theme', t);
-    }}
-    const saved = localStorage.getItem(key);
-    if (saved) applyTheme(saved);
-    document.getElementById('themeToggle').addEventListener('click', () => {{
-      const cur = root.getAttribute('data-theme') || 'auto';
-      const next = cur === 'dark' ? 'light' : (cur === 'light' ? 'auto' : 'dark');
-      localStorage.setItem(key, next); applyTheme(next);
-    }});
-  </script>
-</body></html>"""
-    write_text(os.path.join(OUTPUT_DIR, "index.html"), html)
+    tpl = get_env(site).get_template(site.HOME_TEMPLATE_FILE)
+    write_stream(site, os.path.join(site.OUTPUT_DIR, "index.html"), tpl.generate(
+        site_name=site.SITE_NAME,
+        base_url=site.BASE_URL,
+        nav_sections=[c["section"] for c in catalog_list(site)],
+        printer_section=site.PRINTER_SECTION,
+        sections=[{"name": sec, "count": len(items)} for sec, items in sorted(site.pages_by_section.items())],
+        lookup_url=f"{site.BASE_URL}/{site.LOOKUP_DIR}/",
+        lookup_top_k=site.LOOKUP_TOP_K,
+        last_updated=last_updated or today_iso(),
+    ))
 
 
 def today_iso():
@@ -302,47 +364,445 @@ def safe_int(x, default=None):
     except:
         return default
 
+# Separators that become "-"; everything else outside [a-z0-9-] is dropped
+_SLUG_SEPARATORS = str.maketrans({ch: "-" for ch in " _/.,|—–()[]&+#'\":"})
+_SLUG_DASHES = re.compile(r"-{2,}")
+_SLUG_DISALLOWED = re.compile(r"[^a-z0-9-]+")
+# ASCII in one pass: lowercase, separators -> "-", anything else not [a-z0-9-] -> "\0" (dropped
+# after the dashes collapse, as the old version did: "a-!-b" stays "a--b")
+_SLUG_ASCII = str.maketrans({
+    c: ch.lower() if re.fullmatch(r"[a-z0-9-]", ch.lower()) else "-" if ch in " _/.,|()[]&+#'\":" else "\0"
+    for c, ch in ((c, chr(c)) for c in range(128))
+})
+
 def slugify(text):
-    # Simple, dependency-free slugify
-    allowed = "abcdefghijklmnopqrstuvwxyz0123456789-"
-    text = (text or "").strip().lower()
-    # replace separators with dash
-    for ch in [" ", "_", "/", ".", ",", "|", "—", "–", "(", ")", "[", "]", "&", "+", "#", "'", '"', ":"]:
-        text = text.replace(ch, "-")
-    # collapse multiple dashes
-    while "--" in text:
-        text = text.replace("--", "-")
-    # keep only allowed
-    text = "".join(ch for ch in text if ch in allowed)
+    # Simple, dependency-free slugify. Same output as the old replace-loop version:
+    # dashes are collapsed *before* dropping disallowed chars, so existing URLs don't move.
+    text = (text or "").strip()
+    if text.isascii():
+        # fast path (nearly every SKU and title): one translate; the regex and the
+        # "\0" removal only run when there is something for them to do
+        text = text.translate(_SLUG_ASCII)
+        if "--" in text:
+            text = _SLUG_DASHES.sub("-", text)
+        if "\0" in text:
+            text = text.replace("\0", "")
+        return text.strip("-") or "item"
+    # non-ASCII: str.lower() can turn some of it into ASCII ("K" Kelvin sign -> "k")
+    text = text.lower().translate(_SLUG_SEPARATORS)
+    text = _SLUG_DISALLOWED.sub("", _SLUG_DASHES.sub("-", text))
     return text.strip("-") or "item"
 
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-def write_text(path, content):
-    ensure_dir(os.path.dirname(path))
+def _temp_path(path):
+    # temp file in the target dir so os.replace() stays on one filesystem (atomic)
+    ensure_dir(os.path.dirname(path) or ".")
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix="-" + os.path.basename(path))
+    os.close(fd)
+    os.chmod(tmp, 0o644)
+    return tmp
+
+def replace_if_changed(site, tmp, path):
+    """Move a finished temp file over `path`, or drop it if `path` already has the same bytes."""
+    if os.path.exists(path) and filecmp.cmp(tmp, path, shallow=False):
+        os.remove(tmp)
+        site.write_stats["unchanged"] += 1
+        return 0
+    size = os.path.getsize(tmp)
+    os.replace(tmp, path)
+    drop_siblings(path)
+    site.write_stats["written"] += 1
+    site.write_stats["bytes"] += size
+    return size
+
+def write_text(site, path, content):
+    """Write `content` unless the file already holds the same bytes (size, then content).
+
+    Real writes go to a temp file + os.replace, so a crashed build never leaves a
+    half-written page. Returns the number of bytes written (0 if unchanged).
+    """
+    data = output_bytes(site, path, content)
+    with stage(site, "write_text"):
+        return _write_bytes(site, path, data)
+
+def output_bytes(site, path, content):
+    """The bytes write_text() puts in `path` for `content` (minified first with --minify)."""
+    if site.MINIFY_HTML and path.endswith(".html"):
+        before = len(content)
+        content = minify_html(content)
+        site.write_stats["html_in"] += before
+        site.write_stats["html_out"] += len(content)
+    return content.encode("utf-8")
+
+def write_binary(site, path, data):
+    """write_text() for bytes (no minification)."""
+    with stage(site, "write_text"):
+        return _write_bytes(site, path, data)
+
+def write_stream(site, path, chunks):
+    """write_text() for a Template.generate() stream: chunks go straight to a temp file."""
+    if site.MINIFY_HTML and path.endswith(".html"):
+        return write_text(site, path, "".join(chunks))  # the minifier needs the whole page
+    with stage(site, "write_text"):
+        tmp = _temp_path(path)
+        try:
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.writelines(chunks)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return replace_if_changed(site, tmp, path)
+
+def _write_bytes(site, path, data):
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    site.write_stats["unchanged"] += 1
+                    return 0
+    except OSError:
+        pass  # missing file -> write it
+    tmp = _temp_path(path)
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    drop_siblings(path)
+    site.write_stats["written"] += 1
+    site.write_stats["bytes"] += len(data)
+    return len(data)
+
+def drop_siblings(path):
+    """Remove the .gz/.br siblings of a file that was just rewritten.
+
+    A sibling left behind would still be served (nginx gzip_static, CDNs) with the old
+    content; --precompress writes fresh ones.
+    """
+    for sibling in (path + ".gz", path + ".br"):
+        try:
+            os.remove(sibling)
+        except FileNotFoundError:
+            pass
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# ----------------------------
+# Build profiling (--profile: site.profile, site.slowest_pages)
+# ----------------------------
+class _Stage:
+    __slots__ = ("profile", "name", "t0")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        entry = self.profile.setdefault(self.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.t0
+
+class _NoStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_NO_STAGE = _NoStage()
+
+def stage(site, name):
+    """`with stage(site, "x"):` adds the block's wall time to site.profile["x"]; a no-op unless profiling."""
+    return _NO_STAGE if site.profile is None else _Stage(site.profile, name)
+
+def timed_iter(site, iterable, name):
+    # time spent producing each item (e.g. CSV parsing), not consuming it
+    if site.profile is None:
+        return iterable
+    def gen():
+        it = iter(iterable)
+        while True:
+            with stage(site, name):
+                item = next(it, None)
+            if item is None:
+                return
+            yield item
+    return gen()
+
+def note_page_time(site, slug, seconds):
+    if len(site.slowest_pages) < site.PROFILE_TOP_N:
+        heapq.heappush(site.slowest_pages, (seconds, slug))
+    elif seconds > site.slowest_pages[0][0]:
+        heapq.heapreplace(site.slowest_pages, (seconds, slug))
+
+def drain_profile(site):
+    """Hand this site's profile over (and reset it) -- used to ship worker stats to the parent."""
+    if site.profile is None:
+        return None
+    data = {"stages": site.profile, "slowest": site.slowest_pages}
+    site.profile, site.slowest_pages = {}, []
+    return data
+
+def merge_profile(site, data):
+    if not data:
+        return
+    for name, (calls, seconds) in data["stages"].items():
+        entry = site.profile.setdefault(name, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+    for seconds, slug in data["slowest"]:
+        note_page_time(site, slug, seconds)
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS reports bytes
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    }
+
+def write_profile_report(site, path, total_seconds, extra):
+    stages = {
+        name: {"calls": calls, "seconds": round(seconds, 6)}
+        for name, (calls, seconds) in sorted(site.profile.items(), key=lambda kv: -kv[1][1])
+    }
+    report = {
+        "total_seconds": round(total_seconds, 6),
+        "stages": stages,
+        "peak_rss_kb": peak_rss_kb(),
+        "slowest_pages": [
+            {"slug": slug, "seconds": round(seconds, 6)} for seconds, slug in sorted(site.slowest_pages, reverse=True)
+        ],
+        **extra,
+    }
     with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+        json.dump(report, f, indent=2)
+
+    log.info("Profile (stage times are inclusive; worker stages are summed over processes):")
+    for name, st in stages.items():
+        log.info(f"  {name:<22} {st['calls']:>9} calls {st['seconds']:>10.3f}s")
+    log.info(f"  peak RSS: {report['peak_rss_kb']} KB · report written to {path}")
 
 # ----------------------------
 # Core generation
 # ----------------------------
 
-def load_rows(csv_path, row_limit=None):
-    rows = []
+def iter_rows(csv_path, row_limit=None):
+    """Stream rows from the CSV one at a time (never holds the whole file)."""
     with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f, skipinitialspace=True)
+        # skip blank lines above the header (data/printer_cartridges.csv starts with one)
+        header = next((r for r in csv.reader(f, skipinitialspace=True) if r), None)
+        reader = csv.DictReader(f, fieldnames=header, skipinitialspace=True)
         for i, row in enumerate(reader):
-            rows.append(row)
+            yield row
             if row_limit and i + 1 >= row_limit:
                 break
-    return rows
 
-def load_offers(csv_path):
-    """Load optional offers.csv -> dict[SKU] = [offers]."""
-    if not os.path.exists(csv_path):
-        return {}
-    offers_by_sku = {}
+# -------- Minification + precompressed .gz/.br siblings --------
+_MINIFY_RAW = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_PUNCT_SPACE = re.compile(r"\s*([{};,])\s*")
+_JS_LINE_COMMENT = re.compile(r"^\s*//.*$", re.M)
+
+def _collapse_ws(text):
+    # whitespace runs are equivalent in HTML: keep one newline or one space
+    return re.sub(r"\s+", lambda m: "\n" if "\n" in m.group() else " ", text)
+
+def _minify_block(tag, attrs, body):
+    if tag == "style":
+        return _CSS_PUNCT_SPACE.sub(r"\1", _collapse_ws(_CSS_COMMENT.sub("", body))).strip()
+    if tag == "script" and "ld+json" in attrs:
+        try:
+            return json.dumps(json.loads(body), ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+        except ValueError:
+            return body.strip()
+    if tag == "script":
+        # line-based only (no JS parser here): newlines stay, so ASI is unaffected
+        lines = (line.strip() for line in _JS_LINE_COMMENT.sub("", body).splitlines())
+        return "\n".join(line for line in lines if line)
+    return body  # pre/textarea: whitespace is content
+
+def minify_html(html):
+    """Conservative minifier: comments and indentation go, inline CSS/JS/JSON-LD get compacted."""
+    out, pos = [], 0
+    for m in _MINIFY_RAW.finditer(html):
+        out.append(_collapse_ws(_HTML_COMMENT.sub("", html[pos:m.start()])))
+        out.append(m.group(1) + _minify_block(m.group(2).lower(), m.group(1).lower(), m.group(3)) + m.group(4))
+        pos = m.end()
+    out.append(_collapse_ws(_HTML_COMMENT.sub("", html[pos:])))
+    return "".join(out).strip() + "\n"
+
+def remove_output(path):
+    """Remove a generated file along with its .gz/.br siblings."""
+    for p in (path, path + ".gz", path + ".br"):
+        if os.path.exists(p):
+            os.remove(p)
+
+def _compress_one(path):
+    """(Re)write path.gz / path.br if missing or older than `path` -> (raw, gz, br, compressed?)."""
+    st = os.stat(path)
+    targets = [(".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        targets.append((".br", lambda data: brotli.compress(data, quality=11)))
+    sizes, data, fresh = [], None, False
+    for ext, compress in targets:
+        sibling = path + ext
+        try:
+            sib = os.stat(sibling)
+            if sib.st_mtime_ns >= st.st_mtime_ns:
+                sizes.append(sib.st_size)
+                continue
+        except OSError:
+            pass  # missing -> write it
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        packed = compress(data)
+        tmp = _temp_path(sibling)
+        with open(tmp, "wb") as f:
+            f.write(packed)
+        os.replace(tmp, sibling)
+        sizes.append(len(packed))
+        fresh = True
+    return st.st_size, sizes[0], (sizes[1] if len(sizes) > 1 else 0), fresh
+
+def precompress_outputs(site, root=None, threads=None):
+    """Add .gz (and .br, if brotli is installed) next to every text output that changed.
+
+    A sibling is rewritten only when its source is newer, and write_text() leaves
+    unchanged files alone, so an incremental build only compresses what it wrote.
+    Siblings whose source is gone (or became too small) are removed.
+    Returns byte totals over all outputs: {"files", "compressed", "raw", "gz", "br"}.
+    """
+    root = root or site.OUTPUT_DIR
+    sources, stale = [], []
+    for dirpath, _dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            if name.endswith((".gz", ".br")):
+                base = path[:-3]
+                if dirpath == root and name.startswith("sitemap-") and name.endswith(".xml.gz"):
+                    continue  # a --gzip-sitemaps shard, not a sibling
+                if base.endswith(site.PRECOMPRESS_EXTENSIONS) and not (
+                        os.path.exists(base) and os.path.getsize(base) >= site.PRECOMPRESS_MIN_BYTES):
+                    stale.append(path)
+            elif name.endswith(site.PRECOMPRESS_EXTENSIONS) and not name.startswith(".tmp-"):
+                if os.path.getsize(path) >= site.PRECOMPRESS_MIN_BYTES:
+                    sources.append(path)
+    for path in stale:
+        os.remove(path)
+
+    # zlib and brotli release the GIL, so threads compress in parallel
+    from concurrent.futures import ThreadPoolExecutor
+    totals = {"files": len(sources), "compressed": 0, "raw": 0, "gz": 0, "br": 0}
+    with ThreadPoolExecutor(max_workers=max(1, threads or site.PRECOMPRESS_THREADS)) as pool:
+        for raw, gz, br, fresh in pool.map(_compress_one, sources, chunksize=64):
+            totals["raw"] += raw
+            totals["gz"] += gz
+            totals["br"] += br
+            totals["compressed"] += fresh
+    return totals
+
+# -------- Offers store (columnar records + SKU hash index in an mmap'd snapshot) --------
+_OFFERS_MAGIC = b"OFFERS02"
+_SKU_REC = struct.Struct("<QIII")     # sku blob offset, sku length, first offer, offer count
+_OFFER_REC = struct.Struct("<QIIHBd")  # url blob offset, url length, merchant id, currency id, flags, price (NaN = none)
+_OFFER_IN_STOCK, _OFFER_BEST = 1, 2   # flag bits
+
+class OffersStore:
+    """Read-only offers by SKU, backed by a memory-mapped snapshot of offers.csv.
+
+    Offers are fixed-width records grouped by SKU; strings live in one blob and
+    merchants/currencies are interned. SKUs are found through an open-addressing
+    hash table stored in the snapshot, so a lookup is a couple of struct reads and
+    opening a snapshot costs nothing per row. get() returns fresh offer dicts,
+    already ranked by write_offers_snapshot(); the cheapest in-stock offer in
+    PRICE_CURRENCY (if any) comes first with "best": True.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.n_skus = self.n_offers = 0
+        self._mm = self._slots = None
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mm[:len(_OFFERS_MAGIC)] != _OFFERS_MAGIC:
+                raise ValueError(f"{path}: not an offers snapshot (or an older format)")
+            head_len = struct.unpack_from("<I", self._mm, len(_OFFERS_MAGIC))[0]
+            start = len(_OFFERS_MAGIC) + 4
+            head = json.loads(self._mm[start:start + head_len])
+            self.source = head["source"]
+            self.n_skus, self.n_offers = head["n_skus"], head["n_offers"]
+            self._merchants, self._currencies = head["merchants"], head["currencies"]
+            self._sku_tab, self._offer_tab, self._blob = head["sku_tab"], head["offer_tab"], head["blob"]
+            self._slots = memoryview(self._mm)[head["slots"]:head["slots"] + 4 * head["n_slots"]].cast("I")
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        """Unmap the snapshot (so it can be replaced, even on Windows); the store is empty after."""
+        if self._slots is not None:
+            self._slots.release()
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = self._slots = None
+        self.n_skus = self.n_offers = 0
+
+    def __reduce__(self):
+        # --jobs workers re-map the snapshot instead of pickling its contents
+        return (OffersStore, (self.path,))
+
+    def __len__(self):
+        return self.n_skus
+
+    def get(self, sku, default=None):
+        if not self.n_skus:
+            return default
+        key = sku.encode("utf-8")
+        slots, n = self._slots, len(self._slots)
+        i = zlib.crc32(key) % n
+        while slots[i]:
+            off, length, first, count = _SKU_REC.unpack_from(self._mm, self._sku_tab + (slots[i] - 1) * _SKU_REC.size)
+            if self._mm[self._blob + off:self._blob + off + length] == key:
+                return [self._offer(first + j) for j in range(count)]
+            i = (i + 1) % n
+        return default
+
+    def _offer(self, i):
+        url_off, url_len, merchant, currency, flags, price = _OFFER_REC.unpack_from(
+            self._mm, self._offer_tab + i * _OFFER_REC.size)
+        start = self._blob + url_off
+        return {
+            "merchant": self._merchants[merchant],
+            "url": self._mm[start:start + url_len].decode("utf-8"),
+            "price": None if price != price else price,
+            "currency": self._currencies[currency],
+            "in_stock": bool(flags & _OFFER_IN_STOCK),
+            "best": bool(flags & _OFFER_BEST),
+        }
+
+def offers_source_signature(csv_path, currency):
+    st = os.stat(csv_path)
+    # the site currency (PRICE_CURRENCY) decides which offer ranks best, so it is part of the signature
+    return [os.path.abspath(csv_path), st.st_size, st.st_mtime_ns, sys.byteorder, currency]
+
+def iter_offer_rows(csv_path):
+    """Parse offers.csv -> (SKU, merchant, url, price, currency, in_stock), skipping unusable rows."""
     with open(csv_path, "r", encoding="utf-8", newline="") as f:
         sample = f.read(4096)
         f.seek(0)
@@ -354,19 +814,124 @@ def load_offers(csv_path):
         reader = csv.DictReader(f, dialect=dialect)
         for row in reader:
             sku = (row.get("sku") or "").strip().upper()
-            if not sku:
-                continue
-            offer = {
-                "merchant": (row.get("merchant") or "Online").strip(),
-                "url": (row.get("url") or "").strip(),
-                "price": safe_float(row.get("price")),
-                "currency": (row.get("currency") or "USD").strip(),
-                "in_stock": str(row.get("in_stock") or "1").strip() not in ("0", "false", "False", ""),
-            }
-            if not offer["url"]:
+            url = (row.get("url") or "").strip()
+            if not sku or not url:
                 continue
-            offers_by_sku.setdefault(sku, []).append(offer)
-    return offers_by_sku
+            yield (
+                sku,
+                (row.get("merchant") or "Online").strip(),
+                url,
+                safe_float(row.get("price")),
+                (row.get("currency") or "USD").strip(),
+                str(row.get("in_stock") or "1").strip() not in ("0", "false", "False", ""),
+            )
+
+def write_offers_snapshot(csv_path, snapshot_path, currency):
+    """Compile offers.csv into the binary snapshot OffersStore maps, ranked for `currency`."""
+    skus, urls = [], []
+    merchant_ids, currency_ids = {}, {}
+    merchants, currencies = array("I"), array("H")
+    prices, in_stock = array("d"), bytearray()
+    for sku, merchant, url, price, currency, stock in iter_offer_rows(csv_path):
+        skus.append(sku)
+        urls.append(url.encode("utf-8"))
+        merchants.append(merchant_ids.setdefault(merchant, len(merchant_ids)))
+        currency_ids.setdefault(currency, len(currency_ids))
+        currencies.append(currency_ids[currency])
+        prices.append(float("nan") if price is None else price)
+        in_stock.append(stock)
+
+    # Rank every offer in one bulk sort instead of per page at render time: group by
+    # SKU, then in-stock before out-of-stock, site currency before others, priced
+    # (cheapest first) before unpriced; ties keep offers.csv order (stable sort).
+    home = currency_ids.get(currency, -1)
+    def rank(i):
+        price = prices[i]
+        return (skus[i], not in_stock[i], currencies[i] != home, price != price, price if price == price else 0.0)
+    order = sorted(range(len(skus)), key=rank)
+    blob = bytearray()
+    sku_tab, offer_tab = bytearray(), bytearray()
+    for group_sku, group in itertools.groupby(order, key=skus.__getitem__):
+        first = len(offer_tab) // _OFFER_REC.size
+        count = 0
+        for i in group:
+            flags = _OFFER_IN_STOCK if in_stock[i] else 0
+            # the group's head is the best offer if it is in stock and priced in PRICE_CURRENCY
+            if not count and in_stock[i] and currencies[i] == home and prices[i] == prices[i]:
+                flags |= _OFFER_BEST
+            offer_tab += _OFFER_REC.pack(len(blob), len(urls[i]), merchants[i], currencies[i], flags, prices[i])
+            blob += urls[i]
+            count += 1
+        key = group_sku.encode("utf-8")
+        sku_tab += _SKU_REC.pack(len(blob), len(key), first, count)
+        blob += key
+    n_skus = len(sku_tab) // _SKU_REC.size
+
+    # open addressing at <= 50% load, slot value = SKU record index + 1 (0 = empty)
+    slots = array("I", [0]) * max(1, 2 * n_skus)
+    for idx in range(n_skus):
+        off, length = _SKU_REC.unpack_from(sku_tab, idx * _SKU_REC.size)[:2]
+        i = zlib.crc32(bytes(blob[off:off + length])) % len(slots)
+        while slots[i]:
+            i = (i + 1) % len(slots)
+        slots[i] = idx + 1
+
+    def build(head_len):
+        base = len(_OFFERS_MAGIC) + 4 + head_len
+        head = {
+            "source": offers_source_signature(csv_path, currency),
+            "n_skus": n_skus, "n_offers": len(skus), "n_slots": len(slots),
+            "merchants": list(merchant_ids), "currencies": list(currency_ids),
+            "slots": base,
+            "sku_tab": base + len(slots) * 4,
+            "offer_tab": base + len(slots) * 4 + len(sku_tab),
+            "blob": base + len(slots) * 4 + len(sku_tab) + len(offer_tab),
+        }
+        return json.dumps(head).encode("utf-8")
+
+    # the header stores absolute offsets, which depend on the header's own length
+    head = build(0)
+    while len(head) != len(build(len(head))):
+        head = build(len(head))
+    head = build(len(head))
+
+    tmp = _temp_path(snapshot_path)
+    with open(tmp, "wb") as f:
+        f.write(_OFFERS_MAGIC + struct.pack("<I", len(head)) + head)
+        f.write(slots.tobytes())
+        f.write(sku_tab)
+        f.write(offer_tab)
+        f.write(blob)
+    os.replace(tmp, snapshot_path)
+
+def load_offers(site, csv_path, snapshot_path=None, current=None):
+    """Load optional offers.csv -> OffersStore (SKU -> [offers]).
+
+    The compiled snapshot is reused while offers.csv is unchanged (same path, size
+    and mtime), so a warm start only maps the file. `current`, the store an earlier
+    build loaded, is returned as is in that case (rebuilds in a long-lived process),
+    and closed otherwise.
+    """
+    with stage(site, "load_offers"):
+        snapshot_path = snapshot_path or site.OFFERS_SNAPSHOT
+        if (current is not None and current.path == snapshot_path and os.path.exists(csv_path)
+                and getattr(current, "source", None) == offers_source_signature(csv_path, site.PRICE_CURRENCY)):
+            return current
+        if current is not None:
+            current.close()  # superseded; its map would also keep the snapshot from being replaced
+        if not os.path.exists(csv_path):
+            return OffersStore()
+        store = OffersStore()
+        try:
+            store = OffersStore(snapshot_path)
+            if store.source == offers_source_signature(csv_path, site.PRICE_CURRENCY):
+                log.debug(f"[debug] reusing offers snapshot {snapshot_path}")
+                return store
+        except (OSError, ValueError, KeyError, struct.error):
+            pass  # missing/stale/corrupt snapshot -> rebuild
+        store.close()
+        write_offers_snapshot(csv_path, snapshot_path, site.PRICE_CURRENCY)
+        return OffersStore(snapshot_path)
 
 def amazon_search_link(query, tag):
     q = urllib.parse.quote_plus(query)
@@ -385,32 +950,187 @@ def parse_compatible_models(raw):
     parts = [p.strip() for p in raw.replace(",", ";").split(";")]
     return [p for p in parts if p]
 
-def build_breadcrumbs(section, slug_path):
+def build_breadcrumbs(site, section, slug_path):
     # e.g., /cartridges/tn760/
     crumbs = [
-        {"name": "Home", "url": BASE_URL + "/"},
-        {"name": section.capitalize(), "url": f"{BASE_URL}/{section}/"},
+        {"name": "Home", "url": site.BASE_URL + "/"},
+        {"name": section.capitalize(), "url": f"{site.BASE_URL}/{section}/"},
     ]
     return crumbs
 
-def page_output_path(section, slug):
+def page_output_path(site, section, slug):
     # /docs/cartridges/<slug>/index.html
-    return os.path.join(OUTPUT_DIR, section, slug, "index.html")
+    return os.path.join(site.OUTPUT_DIR, section, slug, "index.html")
+
+def page_url(site, section, slug):
+    return f"{site.BASE_URL}/{section}/{slug}/"
+
+# -------- Build manifest (incremental builds) --------
 
-def page_url(section, slug):
-    return f"{BASE_URL}/{section}/{slug}/"
+def catalog_list(site):
+    """CATALOGS, or the single SECTION / DATA_CSV / TEMPLATE_FILE catalog when it is None."""
+    catalogs = site.CATALOGS or [{"section": site.SECTION, "csv": site.DATA_CSV, "template": site.TEMPLATE_FILE}]
+    sections = [c["section"] for c in catalogs]
+    if len(set(sections)) != len(sections) or site.PRINTER_SECTION in sections:
+        raise ValueError(f"catalog sections must be unique and not {site.PRINTER_SECTION!r}: {sections}")
+    return catalogs
+
+def load_manifest(site, path, printers=None):
+    """Load the previous run's manifest -> {section: {slug: {"hash", "data", "title", "url", "lastmod"}}}.
+
+    `printers`, if given, is filled with the printer pages' render digests {printer slug: digest}.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if "pages" in data:
+        # single-catalog manifest from before CATALOGS
+        return {catalog_list(site)[0]["section"]: data["pages"]}
+    if printers is not None:
+        printers.update(data.get("printers", {}))
+    return data.get("sections", {})
+
+def save_manifest(site, path, manifests, printers=None):
+    # compact: any indent drops json to its pure-Python encoder, ~10x slower on a big catalog
+    write_text(site, path, json.dumps({"sections": manifests, "printers": printers or {}}, sort_keys=True,
+                                      separators=(",", ":")))
+
+def config_digest(site, section=None, template=None):
+    # Anything besides the row/offers that changes page output: template + site config
+    h = hashlib.sha256()
+    with open(os.path.join(site.TEMPLATE_DIR, template or site.TEMPLATE_FILE), "rb") as f:
+        h.update(f.read())
+    for value in (site.SITE_NAME, site.BASE_URL, section or site.SECTION, site.PRICE_CURRENCY,
+                  site.AFFILIATE_AMAZON_TAG, site.MINIFY_HTML):
+        h.update(b"\0" + str(value).encode("utf-8"))
+    h.update(json.dumps(site.page_fragments, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def page_digest(site, row, prior=""):
+    # Hash of one row's data inputs (row + its offers), chained onto `prior` for rows sharing a slug.
+    # Only data: the template/site config is folded in by render_pages(), so lastmod can ignore it.
+    sku_key = (row.get("model_number") or "").strip().upper()
+    payload = json.dumps([row, site.offers_by_sku.get(sku_key, []), prior], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def manifest_entry(prev, row_digest, related_parts, related_printers, cfg_digest, title, url, today):
+    """One page's manifest entry: its data hash, render hash and lastmod (`prev`: last build's entry)."""
+    # related pages are page data too: fold them into the data hash
+    data = hashlib.sha256(json.dumps([row_digest, related_parts, related_printers]).encode("utf-8")).hexdigest()
+    # the render hash adds the template + site config (--minify, fragments, …)
+    digest = hashlib.sha256((cfg_digest + data).encode("ascii")).hexdigest()
+    # lastmod only moves when the page data did: not on template/config changes,
+    # --full or missing files (manifests from before "data" fall back to "hash")
+    data_changed = prev.get("data") != data if "data" in prev else prev.get("hash") != digest
+    lastmod = today if data_changed else prev.get("lastmod", today)
+    return {"hash": digest, "data": data, "title": title, "url": url, "lastmod": lastmod}
+
+def render_key(digest, section, slug, lastmod):
+    # Everything one rendered page depends on: its inputs, its URL and the date printed on it
+    return hashlib.sha256("\0".join((digest, section, slug, lastmod)).encode("utf-8")).hexdigest()
+
+def remove_page(site, section, slug):
+    out_path = page_output_path(site, section, slug)
+    remove_output(out_path)
+    try:
+        os.rmdir(os.path.dirname(out_path))
+    except OSError:
+        pass  # not empty / already gone
 
-# -------- Affiliate offer building (Amazon tag + offers.csv + per-row URL) --------
-OFFERS_BY_SKU = {}
+# -------- Affiliate offer building (Amazon tag + offers.csv + per-row URL, site.offers_by_sku) --------
+def row_slug(row):
+    # Slug: prefer model_number if available; fallback to product name
+    product_name = (row.get("product_name") or "").strip()
+    model_number = (row.get("model_number") or "").strip()
+    return slugify(model_number if model_number else product_name)
+
+class SlugRegistry:
+    """Row identity (SKU, else product name) -> slug, with O(1) collision checks.
+
+    Two different SKUs whose slugs collide ("T252/XL", "T252.XL") get -2, -3, …
+    in the order they are first seen; the mapping is persisted so a slug never
+    moves once published. Rows with the same SKU share one slug (last row wins).
+    """
+
+    def __init__(self, mapping=None):
+        self.by_key = dict(mapping or {})
+        self.owner = {slug: key for key, slug in self.by_key.items()}
+        self._ids = {slug: i for i, slug in enumerate(self.by_key.values())}
+        self._next_suffix = {}
+        self.collisions = 0
+
+    @staticmethod
+    def key_for(row):
+        model_number = (row.get("model_number") or "").strip()
+        if model_number:
+            return "sku:" + model_number.upper()
+        return "name:" + " ".join((row.get("product_name") or "").lower().split())
+
+    def assign(self, row):
+        key = self.key_for(row)
+        slug = self.by_key.get(key)
+        if slug is not None:
+            return slug
+
+        base = slug = row_slug(row)
+        if slug in self.owner:
+            n = self._next_suffix.get(base, 2)
+            while f"{base}-{n}" in self.owner:
+                n += 1
+            slug = f"{base}-{n}"
+            self._next_suffix[base] = n + 1
+            self.collisions += 1
+            log.warning(f"slug collision: {key} and {self.owner[base]} both map to '{base}'; using '{slug}'")
+        self.by_key[key] = slug
+        self.owner[slug] = key
+        self._ids[slug] = len(self._ids)
+        return slug
+
+    def pin(self, slug):
+        """Register a page that is its own key (printer pages) -> its id."""
+        if slug not in self.by_key:
+            self.by_key[slug] = slug  # no owner entry: these never go through assign()
+            self._ids[slug] = len(self._ids)
+        return self._ids[slug]
+
+    def ids(self):
+        """{slug: id} in registry order, which only grows: a page keeps its id for good (search shards).
+
+        The registry's own map: don't modify it.
+        """
+        return self._ids
 
-def build_page_context(row):
+def load_slug_registry(site, path):
+    """-> {section: SlugRegistry}; slugs only need to be unique within a section."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if "sections" not in data:
+        # flat key -> slug mapping from before CATALOGS
+        return {catalog_list(site)[0]["section"]: SlugRegistry(data)}
+    return {section: SlugRegistry(mapping) for section, mapping in data["sections"].items()}
+
+def save_slug_registry(site, path, registries):
+    sections = {section: registry.by_key for section, registry in registries.items()}
+    # insertion order, not sorted: it is the order SlugRegistry.ids() numbers pages in
+    write_text(site, path, json.dumps({"sections": sections}, separators=(",", ":")))
+
+def build_page_context(site, row, related_parts=None, related_printers=None, slug=None, section=None,
+                       last_updated=None):
     product_name = (row.get("product_name") or "").strip()
     model_number = (row.get("model_number") or "").strip()
     price = safe_float(row.get("price"))
     page_yield = safe_int(row.get("page_yield"))
     affiliate_url = (row.get("affiliate_url") or "").strip()
 
-    cpp_raw, cpp_display = compute_cpp(price, page_yield)
     compatible_models = parse_compatible_models(row.get("compatible_models"))
 
     # Basic brand inference (optional; improve later)
@@ -421,33 +1141,39 @@ def build_page_context(row):
     sku_key = model_number.strip().upper()
 
     # 1) offers.csv rows
-    if sku_key and OFFERS_BY_SKU.get(sku_key):
-        affiliate_offers = OFFERS_BY_SKU[sku_key]
+    sku_offers = site.offers_by_sku.get(sku_key) if sku_key else None
+    if sku_offers:
+        affiliate_offers = sku_offers
 
     # 2) per-row affiliate_url
     elif affiliate_url:
         url = affiliate_url.strip()
-        if "amazon." in url and "tag=" not in url and AFFILIATE_AMAZON_TAG:
+        if "amazon." in url and "tag=" not in url and site.AFFILIATE_AMAZON_TAG:
             sep = "&" if "?" in url else "?"
-            url = f"{url}{sep}tag={AFFILIATE_AMAZON_TAG}"
+            url = f"{url}{sep}tag={site.AFFILIATE_AMAZON_TAG}"
         affiliate_offers = [{
             "merchant": "Amazon" if "amazon." in url else "Online",
             "url": url,
             "price": price,  # keep None for Amazon to avoid compliance issues
-            "currency": PRICE_CURRENCY,
+            "currency": site.PRICE_CURRENCY,
             "in_stock": True,
         }]
 
     # 3) fallback to Amazon search by SKU
-    elif AFFILIATE_AMAZON_TAG and model_number:
+    elif site.AFFILIATE_AMAZON_TAG and model_number:
         affiliate_offers = [{
             "merchant": "Amazon",
-            "url": amazon_search_link(model_number, AFFILIATE_AMAZON_TAG),
+            "url": amazon_search_link(model_number, site.AFFILIATE_AMAZON_TAG),
             "price": None,
-            "currency": PRICE_CURRENCY,
+            "currency": site.PRICE_CURRENCY,
             "in_stock": True,
         }]
 
+    # Cost per page from the cheapest in-stock offer (ranked at snapshot time), else the row price
+    best_offer = affiliate_offers[0] if affiliate_offers and affiliate_offers[0].get("best") else None
+    best_price = best_offer["price"] if best_offer else price
+    cpp_raw, cpp_display = compute_cpp(best_price, page_yield)
+
     # FAQs (basic defaults)
     faqs = []
     if page_yield:
@@ -465,17 +1191,18 @@ def build_page_context(row):
 
     sources = []
 
-    # Slug: prefer model_number if available; fallback to product name
-    raw_slug = model_number if model_number else product_name
-    slug = slugify(raw_slug)
+    slug = slug or row_slug(row)
+    section = section or site.SECTION
 
     ctx = {
-        "site_name": SITE_NAME,
+        "site_name": site.SITE_NAME,
         "product_name": product_name,
         "model_number": model_number,
         "brand": brand,
         "price": price,
-        "price_currency": PRICE_CURRENCY,
+        "price_currency": site.PRICE_CURRENCY,
+        "best_price": best_price,
+        "best_offer": best_offer,
         "page_yield": page_yield,
         "cpp_display": cpp_display or "—",
         "compatible_models": compatible_models,
@@ -483,109 +1210,1932 @@ def build_page_context(row):
         "affiliate_offers": affiliate_offers,
         "faqs": faqs,
         "key_points": key_points,
-        "related_parts": [],
-        "related_printers": [],
+        "related_parts": related_parts or [],
+        "related_printers": related_printers or [],
         "sources": sources,
-        "last_updated": today_iso(),
+        "last_updated": last_updated or today_iso(),  # the page's lastmod, so unchanged pages keep their bytes
         "indexable": True,
-        "canonical_url": page_url(SECTION, slug),
-        "breadcrumbs": build_breadcrumbs(SECTION, slug),
-        "base_url": BASE_URL,
-        "section": SECTION
+        "canonical_url": page_url(site, section, slug),
+        "breadcrumbs": build_breadcrumbs(site, section, slug),
+        "base_url": site.BASE_URL,
+        "section": section
     }
     return ctx, slug
 
-def render_pages(rows):
-    env = Environment(
-        loader=FileSystemLoader(TEMPLATE_DIR),
+def make_env(site):
+    bytecode_cache = None
+    if site.TEMPLATE_CACHE_DIR:
+        ensure_dir(site.TEMPLATE_CACHE_DIR)
+        bytecode_cache = FileSystemBytecodeCache(site.TEMPLATE_CACHE_DIR)
+    return Environment(
+        loader=FileSystemLoader(site.TEMPLATE_DIR),
         autoescape=select_autoescape(["html", "xml"]),
         trim_blocks=True,
         lstrip_blocks=True,
+        bytecode_cache=bytecode_cache,
     )
-    tpl = env.get_template(TEMPLATE_FILE)
-
-    urls = []
 
-    for row in rows:
-        ctx, slug = build_page_context(row)
-        if ctx.get("affiliate_offers"):
-            for off in ctx["affiliate_offers"]:
-                print(f"[aff] {ctx['model_number']} -> {off['merchant']}: {off['url']}")
-
-        html = tpl.render(**ctx)
-        out_path = page_output_path(SECTION, slug)
-        write_text(out_path, html)
-        urls.append(ctx["canonical_url"])
-
-        # remember this page for section index
-        PAGES_BY_SECTION.setdefault(SECTION, []).append((slug, ctx["product_name"]))
+def get_env(site):
+    if site.env is None:
+        site.env = make_env(site)
+    return site.env
+
+# -------- Shared page fragments (rendered once per build, not once per page: site.page_fragments) --------
+def build_page_fragments(site, external_css=False, write=True):
+    """Render the build-invariant parts of page_template.html -> {name: Markup}.
+
+    With `external_css` the CSS is written once to ASSETS_DIR/site-<hash>.css and pages
+    only link it; the name changes with the content, so it can be cached indefinitely.
+    Stylesheets from earlier builds are removed. `write=False` (--check) touches no files.
+    """
+    env = get_env(site)
+    shared = {"site_name": site.SITE_NAME, "base_url": site.BASE_URL, "printer_section": site.PRINTER_SECTION,
+              "sections": [c["section"] for c in catalog_list(site)]}
+    css = env.get_template(site.FRAGMENT_CSS).render(shared)
+    assets = os.path.join(site.OUTPUT_DIR, site.ASSETS_DIR)
+    keep = None
+    if external_css:
+        keep = f"site-{hashlib.sha256(css.encode('utf-8')).hexdigest()[:12]}.css"
+        if write:
+            write_text(site, os.path.join(assets, keep), css + "\n")
+        styles = f'<link rel="stylesheet" href="{site.BASE_URL}/{site.ASSETS_DIR}/{keep}" />'
+    else:
+        styles = f"<style>\n{css}\n</style>"
+    for path in glob.glob(os.path.join(assets, "site-*.css")) if write else ():
+        if os.path.basename(path) != keep:
+            remove_output(path)
+    if keep is None and write:
+        try:
+            os.rmdir(assets)
+        except OSError:
+            pass  # not empty / never created
+    return {
+        "styles": Markup(styles),
+        "topbar": Markup(env.get_template(site.FRAGMENT_TOPBAR).render(shared)),
+    }
 
-    return urls
+# -------- Build cache (rendered pages by render_key, kept across builds) --------
+class BuildCache:
+    """Rendered pages in SQLite: render_key -> (zlib'd output bytes, sha256 of those bytes).
+
+    A hit is written straight to disk, with no page context or template render; e.g. a
+    fresh checkout, a deleted output dir or an edit that was reverted. --check only reads
+    the hashes. Pages are stamped with the build that last used them (hit, stored or
+    skipped as unchanged), and close() drops the least recently used ones once their
+    compressed size passes `max_bytes`. A `readonly` cache (--check) never changes the
+    file; one it can't read raises sqlite3.DatabaseError instead of being replaced.
+    """
+
+    def __init__(self, path, max_bytes=None, readonly=False):
+        self.max_bytes = max_bytes or BUILD_CACHE_MAX_BYTES
+        self.readonly = readonly
+        self.hits = self.misses = self.evicted = 0
+        try:
+            self.db = self._open(path, readonly)
+            self.build = (self.db.execute("SELECT MAX(used) FROM pages").fetchone()[0] or 0) + 1
+        except sqlite3.DatabaseError:
+            if readonly:
+                raise
+            # not a cache we can read (corrupt / older layout): it is only a cache, start over
+            os.remove(path)
+            self.db = self._open(path)
+            self.build = 1
+
+    @staticmethod
+    def _open(path, readonly=False):
+        if readonly:
+            return sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True)
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA auto_vacuum = FULL")  # new files only: evictions give the space back
+        db.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                   "out_hash TEXT NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS pages_used ON pages (used)")
+        return db
+
+    def get(self, key):
+        """Output bytes cached for `key`, or None."""
+        row = self.db.execute("SELECT data FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touch((key,))
+        return zlib.decompress(row[0])
+
+    def touch(self, keys):
+        """Mark `keys` as used by this build, so pages that stay unchanged don't age out first."""
+        if not self.readonly:
+            self.db.executemany("UPDATE pages SET used = ? WHERE key = ?", ((self.build, k) for k in keys))
+
+    def out_hash(self, key):
+        """sha256 of the output cached for `key`, or None; doesn't count as a use."""
+        row = self.db.execute("SELECT out_hash FROM pages WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, data, out_hash):
+        self.put_many([(key, data, out_hash)])
+
+    def put_many(self, pages):
+        # (key, data, out_hash) triples; `data` is already zlib-compressed (by the worker
+        # that rendered it). One executemany per render batch, all in the build's transaction.
+        self.db.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                            ((key, data, out_hash, len(data), self.build) for key, data, out_hash in pages))
+
+    def close(self, evict=True):
+        if self.readonly:
+            self.db.close()
+            return
+        if evict:
+            total = self.db.execute("SELECT SUM(size) FROM pages").fetchone()[0] or 0
+            if total > self.max_bytes:
+                # keep the most recently used pages that fit, drop the rest
+                self.evicted = self.db.execute(
+                    "DELETE FROM pages WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER "
+                    "(ORDER BY used DESC, key) AS running FROM pages) WHERE running > ?)",
+                    (self.max_bytes,)).rowcount
+        self.db.commit()
+        self.db.close()
+
+def open_build_cache(site, path, create=True):
+    """BuildCache at `path`, or None when caching is off (or, with create=False, no cache yet).
+
+    create=False opens the cache read-only (--check); an unreadable one is ignored, not replaced.
+    """
+    if not path or (not create and not os.path.exists(path)):
+        return None
+    if create:
+        return BuildCache(path, site.BUILD_CACHE_MAX_BYTES)
+    try:
+        return BuildCache(path, site.BUILD_CACHE_MAX_BYTES, readonly=True)
+    except sqlite3.DatabaseError as e:
+        log.warning(f"[cache] ignoring unreadable build cache {path}: {e}")
+        return None
+
+# -------- Page rendering (serial or --jobs N worker processes) --------
+RENDER_BATCH = 64   # rows per task sent to a worker
+_WORKER_SITE = None  # in a --jobs worker process: the Site it renders for (_init_pool_worker)
+
+def _init_worker(site):
+    # Runs once per worker: offers + compiled templates + fragments are reused for every page it renders
+    get_env(site).globals["fragments"] = site.page_fragments
+    site.page_templates.clear()
+
+def _page_template(site, name):
+    tpl = site.page_templates.get(name)
+    if tpl is None:
+        tpl = site.page_templates[name] = get_env(site).get_template(name)
+    return tpl
+
+def _init_pool_worker(settings, offers_by_sku, fragments, profiling):
+    # forked or spawned, a worker renders for a Site of its own made from the parent's
+    # settings (a SiteBuilder's OUTPUT_DIR, BASE_URL, …, or --catalog), profiled from zero
+    global _WORKER_SITE
+    site = _WORKER_SITE = Site(**settings)
+    site.offers_by_sku, site.page_fragments = offers_by_sku, fragments
+    site.profile = {} if profiling else None
+    _init_worker(site)
+
+def render_one(site, item):
+    """Build, render and write one page -> (section, slug, sku, [(merchant, url), …], cached).
+
+    `item` is (row, related_parts, related_printers, slug, section, template, lastmod, keep);
+    the related lists, the registry slug and the manifest lastmod come from the parent so
+    workers don't each need a copy of the indexes. With `keep`, `cached` is (zlib'd bytes,
+    sha256) for the BuildCache, else None. Printer pages (section PRINTER_SECTION) come with their finished
+    template context in place of `row` (see printer_page_context).
+    """
+    row, related_parts, related_printers, slug, section, template, lastmod, keep = item
+    t0 = time.perf_counter()
+    with stage(site, "build_page_context"):
+        if section == site.PRINTER_SECTION:
+            ctx = row
+        else:
+            ctx, slug = build_page_context(site, row, related_parts, related_printers, slug, section, lastmod)
+    with stage(site, "tpl.render"):
+        html = _page_template(site, template).render(**ctx)
+    path = page_output_path(site, section, slug)
+    data = output_bytes(site, path, html)
+    with stage(site, "write_text"):
+        _write_bytes(site, path, data)
+    cached = None
+    if keep:
+        with stage(site, "build_cache"):
+            # level 1: ~4x faster than the default on HTML and only a few % bigger
+            cached = zlib.compress(data, 1), hashlib.sha256(data).hexdigest()
+    if site.profile is not None:
+        note_page_time(site, slug, time.perf_counter() - t0)
+    offers = [(off["merchant"], off["url"]) for off in ctx.get("affiliate_offers") or []]
+    return section, slug, ctx.get("model_number"), offers, cached
+
+def render_batch(items):
+    # runs in a worker: hand its write counters + profile back to the parent with the results
+    site = _WORKER_SITE
+    before = dict(site.write_stats)
+    results = [render_one(site, item) for item in items]
+    return results, {k: site.write_stats[k] - before[k] for k in site.write_stats}, drain_profile(site)
+
+def render_stream(site, items, jobs=1):
+    """Render items as they arrive; with jobs > 1 at most jobs*2 batches are in flight."""
+    if jobs <= 1:
+        _init_worker(site)
+        for item in items:
+            yield render_one(site, item)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_pool_worker,
+                             initargs=(site.settings(), site.offers_by_sku, site.page_fragments,
+                                       site.profile is not None)) as pool:
+        pending = collections.deque()
+        while True:
+            batch = list(itertools.islice(items, site.RENDER_BATCH))
+            if batch:
+                pending.append(pool.submit(render_batch, batch))
+            if pending and (not batch or len(pending) >= jobs * 2):
+                results, written, profile = pending.popleft().result()
+                for k, v in written.items():
+                    site.write_stats[k] += v
+                merge_profile(site, profile)
+                yield from results
+            elif not batch:
+                return
+
+def render_pages(site, catalogs, read_rows, manifests=None, force=False, jobs=1, slugs=None,
+                 cache=None, dry_run=False):
+    """Stream rows -> context -> render -> write, one page per slug, for every catalog.
+
+    `catalogs` are {"section", "csv", "template"} dicts and `read_rows(catalog)` returns a
+    fresh row iterator; each catalog is read twice (hash pass, render pass) so no row is
+    kept in memory. All catalogs share one render stream (and one worker pool with --jobs).
+    Pages whose digest matches `manifests[section]` are skipped unless `force`; each old
+    entry is popped from `manifests` as its page comes up, so the two manifests aren't
+    both held in full (what is left are the removed pages). Only
+    compact (slug, title, url) records are kept, one per page, in site.pages_by_section, for the
+    indexes and sitemap; they come out in row order whatever `jobs` is.
+    Slugs come from the per-section SlugRegistry in `slugs` (added here when missing), so
+    colliding SKUs get distinct pages.
+    Pages found in `cache` (a BuildCache) are copied from it instead of rendered, except
+    with `force`; every page rendered is added to it.
+    Returns (new_manifests, stats) where stats counts rendered/cached/skipped/removed pages.
+    With `dry_run` (--check) nothing is rendered, written or removed; stats["changes"] then
+    lists, by kind, the URLs the build would touch (see check_pages).
+    """
+    manifests = manifests or {}
+    slugs = {} if slugs is None else slugs
+    for catalog in catalogs:
+        slugs.setdefault(catalog["section"], SlugRegistry())
+
+    # Pass 1: rows sharing a slug overwrite each other (last wins), so hash them together
+    # and render only the last one -- two workers never write the same file.
+    # The same pass collects titles + compatible printers for the printer index.
+    # Pages are keyed by (section, slug).
+    digests, remaining = {}, collections.Counter()
+    titles, models_by_page = {}, {}
+    cfg_digests = {c["section"]: config_digest(site, c["section"], c["template"]) for c in catalogs}
+    for catalog in catalogs:
+        section, assign_slug = catalog["section"], slugs[catalog["section"]].assign
+        for row in read_rows(catalog):
+            page = (section, assign_slug(row))
+            digests[page] = page_digest(site, row, digests.get(page, ""))
+            remaining[page] += 1
+            titles[page] = (row.get("product_name") or "").strip()
+            models_by_page[page] = parse_compatible_models(row.get("compatible_models"))
+
+    site.printer_index = build_printer_index(models_by_page)
+    del models_by_page  # pass 2 re-parses each page's list from its row
+
+    new_manifests = {catalog["section"]: {} for catalog in catalogs}
+    stats = {"pages": len(digests), "rendered": 0, "cached": 0, "skipped": 0, "removed": 0}
+    changes = {kind: [] for kind in ("new", "changed", "rerender", "removed")}
+    render_keys = {}  # (section, slug) -> render_key, for pages out at the workers
+    unchanged_keys = []  # render_keys of pages skipped as unchanged, to keep them fresh in the cache
+    today = today_iso()  # one date per build, even across midnight
+
+    def changed_rows():
+        # Pass 2: record every page once (at the row that owns it), yield only the rows that need rendering
+        for catalog in catalogs:
+            section, template = catalog["section"], catalog["template"]
+            assign_slug, page_ids = slugs[section].assign, slugs[section].ids()
+            records = site.pages_by_section.setdefault(section, [])
+            manifest, new_manifest = manifests.get(section, {}), new_manifests[section]
+            for row in read_rows(catalog):
+                slug = assign_slug(row)
+                page = (section, slug)
+                remaining[page] -= 1
+                if remaining[page]:
+                    continue  # a later row owns this slug (and its record)
+                del remaining[page]
+                title, url = (row.get("product_name") or "").strip(), page_url(site, section, slug)
+                records.append((slug, title, url))
+                index_search_tokens(site, section, page_ids[slug], row)
+
+                models = parse_compatible_models(row.get("compatible_models"))
+                related_parts, related_printers = page_related(site, page, models, titles)
+                # the last build's entry (and this page's digest) are done with once the new entry is in
+                prev = manifest.pop(slug, {})
+                entry = new_manifest[slug] = manifest_entry(
+                    prev, digests.pop(page), related_parts, related_printers, cfg_digests[section], title, url, today)
+                digest, lastmod = entry["hash"], entry["lastmod"]
+                changed = prev.get("hash") != digest
+                path = page_output_path(site, section, slug)
+                exists = os.path.exists(path)
+                key = render_key(digest, section, slug, lastmod) if cache is not None else None
+                if not (force or changed or not exists):
+                    if key:
+                        unchanged_keys.append(key)
+                    continue
+                if dry_run:
+                    out_hash = cache.out_hash(key) if key else None
+                    if not exists:
+                        changes["new"].append(url)
+                    elif out_hash is None:
+                        changes["rerender"].append(url)  # inputs changed, output unknown until rendered
+                    elif out_hash != file_sha256(path):
+                        changes["changed"].append(url)
+                    continue
+                if key and not force:
+                    with stage(site, "build_cache"):
+                        data = cache.get(key)
+                    if data is not None:
+                        with stage(site, "write_text"):
+                            _write_bytes(site, path, data)
+                        stats["cached"] += 1
+                        continue
+                if key and force and cache.out_hash(key) is not None:
+                    unchanged_keys.append(key)  # --full re-renders it, but the cached copy is the same page
+                    key = None
+                if key:
+                    render_keys[(section, slug)] = key
+                yield row, related_parts, related_printers, slug, section, template, lastmod, key is not None
+
+    log_offers = log.isEnabledFor(logging.DEBUG)
+    if dry_run:
+        collections.deque(changed_rows(), maxlen=0)  # classifies every page, renders none
+        stats["changes"] = changes
+    to_cache = []  # (key, data, out_hash) of rendered pages, stored one render batch at a time
+    for section, slug, sku, offers, cached in () if dry_run else render_stream(site, changed_rows(), jobs):
+        if log_offers:
+            for merchant, url in offers:
+                log.debug("[aff] %s -> %s: %s", sku, merchant, url)
+        if cached:
+            to_cache.append((render_keys.pop((section, slug)), *cached))
+            if len(to_cache) >= site.RENDER_BATCH:
+                with stage(site, "build_cache"):
+                    cache.put_many(to_cache)
+                to_cache.clear()
+        stats["rendered"] += 1
+    if to_cache:
+        with stage(site, "build_cache"):
+            cache.put_many(to_cache)
+    stats["skipped"] = stats["pages"] - stats["rendered"] - stats["cached"]
+    if unchanged_keys and not dry_run:
+        with stage(site, "build_cache"):
+            cache.touch(unchanged_keys)
+
+    # drop pages whose rows (or whole catalog) are gone: what pass 2 left in `manifests`
+    for section, manifest in manifests.items():
+        for slug in list(manifest):
+            stats["removed"] += 1
+            if dry_run:
+                changes["removed"].append(manifest[slug].get("url") or page_url(site, section, slug))
+                continue
+            remove_page(site, section, slug)
+        if dry_run:
+            continue
+        if section not in new_manifests:
+            shutil.rmtree(os.path.join(site.OUTPUT_DIR, section), ignore_errors=True)  # its index + search shards
+
+    return new_manifests, stats
+
+# -------- Printer reverse index (printer model -> cartridge slugs, site.printer_index) --------
+@functools.lru_cache(maxsize=1 << 16)
+def printer_key(name):
+    # "HP  ENVY-4520" and "hp envy 4520" are the same printer; the slug doubles as the key
+    return slugify(" ".join(name.split()))
+
+def printer_keys(models):
+    return list(dict.fromkeys(printer_key(m) for m in models))
+
+def build_printer_index(models_by_page):
+    """Invert {(section, slug): [printer names]} in one pass over the compatibility lists."""
+    printers = {}
+    for page, models in models_by_page.items():
+        for name in models:
+            key = printer_key(name)
+            entry = printers.setdefault(key, {"name": " ".join(name.split()), "pages": []})
+            if not entry["pages"] or entry["pages"][-1] != page:
+                entry["pages"].append(page)
+    return printers
+
+def related_parts_for(site, page, keys, titles, limit=None):
+    """Pages (from any catalog) sharing the most printers with `page`, walking only its printers' postings."""
+    shared = collections.Counter()
+    for key in keys:
+        for other in site.printer_index[key]["pages"]:
+            if other != page:
+                shared[other] += 1
+    top = heapq.nsmallest(limit or site.RELATED_PARTS_LIMIT, shared,
+                          key=lambda o: (-shared[o], titles[o].lower(), o))
+    return [{"name": titles[o], "url": page_url(site, *o)} for o in top]
+
+def printer_page_context(site, key, name, cartridges):
+    # the CSS and top bar come from site.page_fragments, like cartridge pages
+    url = page_url(site, site.PRINTER_SECTION, key)
+    return {
+        "site_name": site.SITE_NAME,
+        "base_url": site.BASE_URL,
+        "printer_name": name,
+        "cartridges": cartridges,
+        "canonical_url": url,
+        "breadcrumbs": [
+            {"name": "Home", "url": site.BASE_URL + "/"},
+            {"name": site.PRINTER_SECTION.capitalize(), "url": f"{site.BASE_URL}/{site.PRINTER_SECTION}/"},
+            {"name": name, "url": url},
+        ],
+    }
 
-def build_homepage(urls):
+def page_related(site, page, models, titles):
+    """(related parts, related printers) shown on `page`, a cartridge fitting the printers in `models`."""
+    keys = printer_keys(models)
+    related_parts = related_parts_for(site, page, keys, titles)
+    related_printers = [{"name": site.printer_index[k]["name"], "url": page_url(site, site.PRINTER_SECTION, k)}
+                        for k in keys]
+    return related_parts, related_printers
+
+def build_printer_pages(site, manifests, digests=None, force=False, jobs=1, keys=None, slugs=None):
+    """Render /printers/<slug>/ for every printer in site.printer_index -> [(url, lastmod)] for the sitemap.
+
+    Cartridges come from every catalog (`manifests` is {section: {slug: entry}}).
+    A printer page's lastmod is the newest lastmod among its cartridges.
+    `digests` ({printer slug: digest}, saved in the build manifest) is updated in place;
+    only printers whose digest changed (or whose file is missing) are rendered, unless
+    `force`, and they go through render_stream() like every other page.
+    With `keys` (--watch: the printers of the cartridges that changed) only those are
+    checked, rendered or removed, and the printer records and search tokens are kept.
+    Printers are pinned in `slugs` ({section: SlugRegistry}) under PRINTER_SECTION, which
+    numbers them for search.
+    """
+    digests = {} if digests is None else digests
+    registry = ({} if slugs is None else slugs).setdefault(site.PRINTER_SECTION, SlugRegistry())
+    env = get_env(site)
+    tpl_digest = hashlib.sha256(env.loader.get_source(env, site.PRINTER_TEMPLATE_FILE)[0].encode("utf-8")).hexdigest()
+    # the shared CSS + top bar (partials, nav sections, --external-css) are part of every printer page
+    fragments_digest = hashlib.sha256(json.dumps(site.page_fragments, sort_keys=True).encode("utf-8")).hexdigest()
+    if keys is None:
+        records = site.pages_by_section[site.PRINTER_SECTION] = []
+        site.search_index.pop(site.PRINTER_SECTION, None)
+    entries = []
+
+    def changed_printers():
+        # yielded as render_stream() takes them, so only a batch of contexts is alive at a time
+        for key, printer in sorted(site.printer_index.items()):
+            url = page_url(site, site.PRINTER_SECTION, key)
+            lastmod = max(manifests[sec][s]["lastmod"] for sec, s in printer["pages"])
+            entries.append((url, lastmod))
+            if keys is not None and key not in keys:
+                continue
+            if keys is None:
+                records.append((key, printer["name"], url))
+                index_search_tokens(site, site.PRINTER_SECTION, registry.pin(key), {"product_name": printer["name"]})
+            cartridges = sorted(
+                ({"name": manifests[sec][s]["title"], "url": manifests[sec][s]["url"]} for sec, s in printer["pages"]),
+                key=lambda c: c["name"].lower(),
+            )
+
+            digest = hashlib.sha256(json.dumps(
+                [tpl_digest, fragments_digest, site.SITE_NAME, site.BASE_URL, site.MINIFY_HTML, printer["name"],
+                 cartridges]
+            ).encode("utf-8")).hexdigest()
+            path = page_output_path(site, site.PRINTER_SECTION, key)
+            if not force and digests.get(key) == digest and os.path.exists(path):
+                continue
+            digests[key] = digest
+            yield (printer_page_context(site, key, printer["name"], cartridges), None, None,
+                   key, site.PRINTER_SECTION, site.PRINTER_TEMPLATE_FILE, lastmod, False)
+
+    collections.deque(render_stream(site, changed_printers(), jobs), maxlen=0)
+    for key in digests.keys() - site.printer_index.keys():
+        del digests[key]
+
+    # drop printers no cartridge lists anymore
+    if keys is not None:
+        for key in keys - site.printer_index.keys():
+            remove_page(site, site.PRINTER_SECTION, key)
+        return entries
+    for path in glob.glob(os.path.join(site.OUTPUT_DIR, site.PRINTER_SECTION, "*", "index.html")):
+        key = os.path.basename(os.path.dirname(path))
+        if key not in site.printer_index and key not in ("page", "search"):
+            remove_page(site, site.PRINTER_SECTION, key)
+    return entries
+
+def build_homepage(site, urls):
     # Simple homepage that links to first N pages (kept for reference; not used)
     N = min(100, len(urls))
     links = "\n".join(f'<li><a href="{u}">{u}</a></li>' for u in urls[:N])
     html = f"""<!doctype html>
 <html lang="en"><head>
 <meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
-<title>{SITE_NAME} – Compatibility & Replacements</title>
-<meta name="description" content="{SITE_NAME}: find compatible parts and replacements.">
-<link rel="canonical" href="{BASE_URL}/" />
+<title>{site.SITE_NAME} – Compatibility & Replacements</title>
+<meta name="description" content="{site.SITE_NAME}: find compatible parts and replacements.">
+<link rel="canonical" href="{site.BASE_URL}/" />
 </head><body>
 <div style="max-width:1000px;margin:0 auto;padding:24px;font-family:system-ui;">
-  <h1>{SITE_NAME}</h1>
+  <h1>{site.SITE_NAME}</h1>
   <p>Find compatible parts and replacements for printers, filters, and chargers.</p>
   <h2>Latest pages</h2>
   <ul>{links}</ul>
 </div>
 </body></html>"""
-    write_text(os.path.join(OUTPUT_DIR, "index.html"), html)
+    write_text(site, os.path.join(site.OUTPUT_DIR, "index.html"), html)
+
+class SitemapWriter:
+    """Streams <url> entries into sitemap-N.xml shards, rolling over at the protocol limits.
+
+    Shards are written straight to disk (optionally gzip-compressed), so memory stays
+    flat however many URLs go through. close() returns the shard file names;
+    `lastmods` maps each shard to the newest lastmod in it. Writes count in site.write_stats.
+    """
+    HEAD = b'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    TAIL = b"</urlset>\n"
+
+    def __init__(self, site, out_dir, compress=False, max_urls=None, max_bytes=None):
+        self.site = site
+        self.out_dir = out_dir
+        self.compress = compress
+        self.max_urls = max_urls or site.SITEMAP_MAX_URLS
+        self.max_bytes = max_bytes or site.SITEMAP_MAX_BYTES
+        self.shards = []
+        self.lastmods = {}
+        self._f = None
+        self._count = 0
+        self._bytes = 0
+
+    def _open_shard(self):
+        name = f"sitemap-{len(self.shards) + 1}.xml" + (".gz" if self.compress else "")
+        self._path = os.path.join(self.out_dir, name)
+        self._tmp = _temp_path(self._path)
+        self._raw = open(self._tmp, "wb")
+        # no name + mtime=0 in the gzip header keeps .gz bytes stable between builds
+        self._f = gzip.GzipFile(filename="", fileobj=self._raw, mode="wb", mtime=0) if self.compress else self._raw
+        self._f.write(self.HEAD)
+        self.shards.append(name)
+        self._count, self._bytes = 0, len(self.HEAD) + len(self.TAIL)
+
+    def _close_shard(self):
+        if self._f:
+            self._f.write(self.TAIL)
+            self._f.close()
+            self._raw.close()
+            self._f = None
+            replace_if_changed(self.site, self._tmp, self._path)
+
+    def add(self, url, lastmod):
+        loc = xml_escape(urllib.parse.quote(url, safe=":/?&="))
+        entry = f"<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>\n".encode("utf-8")
+        # size limit applies to the uncompressed file
+        if self._f is None or self._count >= self.max_urls or self._bytes + len(entry) > self.max_bytes:
+            self._close_shard()
+            self._open_shard()
+        self._f.write(entry)
+        name = self.shards[-1]
+        if lastmod > self.lastmods.get(name, ""):
+            self.lastmods[name] = lastmod
+        self._count += 1
+        self._bytes += len(entry)
+
+    def close(self):
+        self._close_shard()
+        return self.shards
+
+def build_sitemap(site, entries, compress=False, home_lastmod=None):
+    """Write sitemap-N.xml shards + sitemap_index.xml from (url, lastmod) pairs.
+
+    Each shard's lastmod in the index is the newest lastmod in it, so shards whose pages
+    didn't change keep their bytes (and their index entry) between builds.
+    """
+    writer = SitemapWriter(site, site.OUTPUT_DIR, compress=compress)
+    writer.add(f"{site.BASE_URL}/", home_lastmod or today_iso())
+    for url, lastmod in entries:
+        writer.add(url, lastmod)
+    shards = writer.close()
+
+    # remove shards (or the old single sitemap.xml) left over from a larger build or
+    # another --gzip-sitemaps setting, with their .gz/.br siblings
+    for pattern in ("sitemap.xml", "sitemap-*.xml", "sitemap-*.xml.gz", "sitemap-*.xml.br"):
+        for path in glob.glob(os.path.join(site.OUTPUT_DIR, pattern)):
+            name = os.path.basename(path)
+            # sitemap-N.xml.gz is either a shard or the --precompress sibling of one
+            if name in shards or (name.endswith((".gz", ".br")) and name[:-3] in shards):
+                continue
+            if name + ".gz" in shards:
+                os.remove(path)  # its .gz is now the shard itself; a stale .br matches the last pattern
+            else:
+                remove_output(path)
 
-def build_sitemap(urls):
-    # Single-file sitemap for now
-    lastmod = today_iso()
     items = "\n".join(
-        f"<url><loc>{urllib.parse.quote(u, safe=':/?&=')}</loc><lastmod>{lastmod}</lastmod></url>"
-        for u in urls
+        f"<sitemap><loc>{site.BASE_URL}/{name}</loc><lastmod>{writer.lastmods[name]}</lastmod></sitemap>"
+        for name in shards
     )
     xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-<url><loc>{BASE_URL}/</loc><lastmod>{lastmod}</lastmod></url>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
 {items}
-</urlset>"""
-    write_text(os.path.join(OUTPUT_DIR, "sitemap.xml"), xml)
+</sitemapindex>"""
+    write_text(site, os.path.join(site.OUTPUT_DIR, "sitemap_index.xml"), xml)
+    return shards
 
-def build_robots():
+def build_robots(site):
     txt = f"""User-agent: *
 Allow: /
 
-Sitemap: {BASE_URL}/sitemap.xml
+Sitemap: {site.BASE_URL}/sitemap_index.xml
 """
-    write_text(os.path.join(OUTPUT_DIR, "robots.txt"), txt)
-
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    # Load data
-    rows = load_rows(DATA_CSV, row_limit=ROW_LIMIT)
-
-    # Load optional offers mapping once
-    global OFFERS_BY_SKU
-    OFFERS_BY_SKU = load_offers(AFFILIATE_OFFERS_CSV)
-
-    print(f"[debug] loaded {len(rows)} data rows from {DATA_CSV}")
-    print(f"[debug] loaded {sum(len(v) for v in OFFERS_BY_SKU.values())} offers from {AFFILIATE_OFFERS_CSV}" if OFFERS_BY_SKU else "[debug] no offers.csv found")
-
-    # Render pages
-    urls = render_pages(rows)
-
-    # Build indexes + static files
-    build_section_index(SECTION)
-    build_homepage_full()
-    build_sitemap(urls)
-    build_robots()
-    print(f"Generated {len(urls)} pages into ./{OUTPUT_DIR}")
+    write_text(site, os.path.join(site.OUTPUT_DIR, "robots.txt"), txt)
+
+# -------- Fuzzy lookup (printer / cartridge trigram index, shared with lookup.js) --------
+_LOOKUP_MAGIC = b"LOOKUP02"
+# magic, doc ids, printers, printer + cartridge stop trigrams, shards, block, top printers, min score, length weight
+_LOOKUP_HEAD = struct.Struct("<8sIIIIIIIdd")
+_LOOKUP_PRINTER = 0x8000  # flag on a printer's per-doc u16 in meta.bin, under which is its trigram count
+_TRIGRAM_CODES = bytes.maketrans(b" 0123456789abcdefghijklmnopqrstuvwxyz", bytes(range(37)))  # char -> 0..36
+
+def lookup_words(text):
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+def trigrams(words, prefix=False):
+    """Set of the trigram codes of `words`, each word padded as "  envy " ("  e", " en", …, "vy ").
+
+    With `prefix` (queries: the user may still be typing) the last word gets no end
+    padding, so "lc470" also matches "lc470xl".
+    """
+    codes = set()
+    for i, word in enumerate(words):
+        codes.update(_word_trigrams(word, not prefix or i < len(words) - 1))
+    return codes
+
+@functools.lru_cache(maxsize=1 << 12)
+def _word_trigrams(word, end):
+    # brands, colors, "cartridge", printer lines repeat across docs; SKUs mostly don't,
+    # so a small cache holds the hits without keeping every word's codes alive
+    c = ("  " + word + (" " if end else "")).encode("ascii").translate(_TRIGRAM_CODES)
+    return tuple((a * 37 + b) * 37 + d for a, b, d in zip(c, c[1:], c[2:]))
+
+def _u32(values):
+    # the index is read as Uint32Array in the browser: always little-endian on disk
+    arr = values if isinstance(values, array) else array("I", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+def _u16(values):
+    arr = array("H", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+def _read_u32(data):
+    arr = array("I")
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return memoryview(arr)
+
+def _lookup_ids(out_dir):
+    """{path: doc id} of the published index (empty when there is none, or in another format)."""
+    try:
+        with open(os.path.join(out_dir, "meta.bin"), "rb") as f:
+            head = f.read(_LOOKUP_HEAD.size)
+        magic, n_docs, _printers, _stops, _stops, _shards, block, *_rest = _LOOKUP_HEAD.unpack(head)
+    except (OSError, struct.error):
+        return {}
+    if magic != _LOOKUP_MAGIC:
+        return {}
+    ids = {}
+    for n in range(0, n_docs, block):
+        try:
+            with open(os.path.join(out_dir, f"d-{n // block}.json"), encoding="utf-8") as f:
+                docs = json.load(f)
+        except FileNotFoundError:
+            continue  # every doc in it was removed
+        for i, doc in enumerate(docs, n):
+            if doc is not None:
+                ids[doc[1]] = i
+    return ids
+
+def build_lookup_index(site, manifests):
+    """Write OUTPUT_DIR/LOOKUP_DIR/, the index FuzzyLookup and lookup.js query -> doc count.
+
+    Docs are every printer (site.printer_index) and cartridge page, keyed by path. A doc keeps
+    the id it was published with (read back from the d-N.json blocks) and new docs are
+    numbered after the last one, printers by key then cartridges by title; a removed
+    doc's id stays unused (null in its block), so adding or removing a page only
+    rewrites meta.bin, the shards of its trigrams and the blocks of it and its printers.
+    Ids are renumbered once unused ones outnumber the docs. Doc ids are the tie-break order.
+    Printers are indexed by name, cartridges by title plus SKU (the slug, also joined:
+    "tn-227bk" -> "tn227bk"). Trigrams found in more than LOOKUP_STOP_DF of the printers
+    (" hp", "bro") or of the cartridges ("car", "ink") are stop trigrams for that kind:
+    not indexed for it and not counted on either side of its scores, which keeps the
+    postings small and the queries fast. Files:
+      meta.bin  header, printer then cartridge stop trigram codes (u32), then per doc id a
+                u16: its trigram count, with _LOOKUP_PRINTER set for printers (0: unused)
+      t-N.bin   trigrams with code % LOOKUP_SHARDS == N: u32 count, codes, end offsets,
+                then the ascending doc ids of each trigram
+      d-N.json  docs N*LOOKUP_BLOCK…: [name, path] (null: unused); printers add
+                [cartridge doc ids]
+    """
+    out_dir = os.path.join(site.OUTPUT_DIR, site.LOOKUP_DIR)
+    printers = [(f"{site.PRINTER_SECTION}/{key}", key, printer) for key, printer in sorted(site.printer_index.items())]
+    cartridges = sorted(
+        ((f"{section}/{slug}", entry["title"]) for section, manifest in manifests.items()
+         for slug, entry in manifest.items()),
+        key=lambda c: (c[1].lower(), c[0]),
+    )
+    paths = [path for path, _key, _printer in printers] + [path for path, _title in cartridges]
+    published = _lookup_ids(out_dir)
+    ids = {path: published[path] for path in paths if path in published}
+    next_id = max(ids.values(), default=-1) + 1
+    if next_id - len(ids) > len(paths):
+        ids, next_id = {}, 0  # more unused ids than docs: start over
+    for path in paths:
+        if path not in ids:
+            ids[path] = next_id
+            next_id += 1
+
+    # one slot per id: (kind flag, path, printer or title); docs are made from it in id
+    # order and written out a block at a time, and a doc's trigrams are only kept as their
+    # count, which the stop trigrams are taken off below
+    slots = [None] * next_id
+    for path, _key, printer in printers:
+        slots[ids[path]] = (_LOOKUP_PRINTER, path, printer)
+    for path, title in cartridges:
+        slots[ids[path]] = (0, path, title)
+    # postings as u32 arrays (a Python int list costs ~9x the memory at 100k docs), per
+    # kind (printers, cartridges), ascending since docs are added in id order
+    lens, block, written = array("H"), [], set()
+    postings = (collections.defaultdict(lambda: array("I")), collections.defaultdict(lambda: array("I")))
+    for i, slot in enumerate(slots):
+        if slot is None:  # a removed doc's id
+            doc = None
+            lens.append(0)
+        else:
+            flag, path, value = slot
+            if flag:
+                doc = [value["name"], path, sorted(ids[f"{sec}/{slug}"] for sec, slug in value["pages"])]
+                words = lookup_words(value["name"])
+            else:
+                slug = path.rsplit("/", 1)[1]
+                doc = [value, path]
+                words = lookup_words(value) + slug.split("-") + [slug.replace("-", "")]
+            codes, kind_postings = trigrams(words), postings[not flag]
+            for code in codes:
+                kind_postings[code].append(i)
+            lens.append(min(len(codes), _LOOKUP_PRINTER - 1) | flag)
+        block.append(doc)
+        if len(block) == site.LOOKUP_BLOCK or i == len(slots) - 1:
+            if any(doc is not None for doc in block):
+                name = f"d-{i // site.LOOKUP_BLOCK}.json"
+                write_text(site, os.path.join(out_dir, name),
+                           json.dumps(block, separators=(",", ":"), ensure_ascii=False))
+                written.add(name)
+            block = []
+    del slots
+
+    # Stop trigrams, per kind
+    stops = []
+    for kind_postings, n in zip(postings, (len(printers), len(cartridges))):
+        max_df = max(site.LOOKUP_STOP_MIN_DOCS, int(site.LOOKUP_STOP_DF * n))
+        stop = sorted(code for code, ids_ in kind_postings.items() if len(ids_) > max_df)
+        for code in stop:
+            for i in kind_postings.pop(code):
+                lens[i] -= 1
+        stops.append(stop)
+
+    written.add("meta.bin")
+    write_binary(site, os.path.join(out_dir, "meta.bin"), _LOOKUP_HEAD.pack(
+        _LOOKUP_MAGIC, len(lens), len(printers), len(stops[0]), len(stops[1]), site.LOOKUP_SHARDS,
+        site.LOOKUP_BLOCK, site.LOOKUP_PRINTERS, site.LOOKUP_MIN_SCORE, site.LOOKUP_LENGTH_WEIGHT)
+        + _u32(stops[0] + stops[1]) + _u16(lens))
+    shards = collections.defaultdict(list)
+    for code in sorted(postings[0].keys() | postings[1].keys()):
+        shards[code % site.LOOKUP_SHARDS].append(code)
+    for n in range(site.LOOKUP_SHARDS):
+        codes = shards.get(n, [])
+        # both kinds' ids in one ascending list; written once, so each list is freed as it goes out
+        lists = []
+        for code in codes:
+            a, b = postings[0].pop(code, None), postings[1].pop(code, None)
+            lists.append(array("I", sorted(a + b)) if a and b else a or b)
+        shard = array("I", [len(codes)])
+        shard.extend(codes)
+        shard.extend(itertools.accumulate(map(len, lists)))
+        for ids_ in lists:
+            shard.extend(ids_)
+        write_binary(site, os.path.join(out_dir, f"t-{n}.bin"), _u32(shard))
+        written.add(f"t-{n}.bin")
+
+    for path in glob.glob(os.path.join(out_dir, "*.*")):
+        if os.path.basename(path) not in written and not path.endswith((".gz", ".br")):
+            remove_output(path)
+    return len(printers) + len(cartridges)
+
+class FuzzyLookup:
+    """Query a build_lookup_index() directory; ranks exactly like templates/partials/lookup.js.
+
+    The postings are loaded up front (a few MB at 100k SKUs), the name/path blocks on
+    first use. A doc scores hits / (query trigrams + weight * unmatched doc trigrams),
+    leaving its kind's stop trigrams out of both; a cartridge takes the better of
+    its own score and that of the best-matching of the top LOOKUP_PRINTERS printers it fits.
+    """
+
+    def __init__(self, path=None, base_url=None):
+        self.path = path or os.path.join(OUTPUT_DIR, LOOKUP_DIR)
+        self.base_url = BASE_URL if base_url is None else base_url
+        with open(os.path.join(self.path, "meta.bin"), "rb") as f:
+            meta = f.read()
+        (magic, self.n_docs, self.n_printers, n_stop_printers, n_stop_cartridges, n_shards, self.block,
+         self.top_printers, self.min_score, self.length_weight) = _LOOKUP_HEAD.unpack_from(meta)
+        if magic != _LOOKUP_MAGIC:
+            raise ValueError(f"{self.path}: not a lookup index (or an older format)")
+        stop = _read_u32(meta[_LOOKUP_HEAD.size:_LOOKUP_HEAD.size + 4 * (n_stop_printers + n_stop_cartridges)])
+        self.stops = (frozenset(stop[:n_stop_printers]), frozenset(stop[n_stop_printers:]))
+        flags = array("H")
+        flags.frombytes(meta[_LOOKUP_HEAD.size + 4 * len(stop):])
+        if sys.byteorder == "big":
+            flags.byteswap()
+        self.lens = array("H", (f & ~_LOOKUP_PRINTER for f in flags))  # trigram count by doc id
+        self.kinds = bytes(f < _LOOKUP_PRINTER for f in flags)       # 0 printer, 1 cartridge
+        self.postings = {}  # trigram code -> ascending doc ids (a view into its shard)
+        for n in range(n_shards):
+            with open(os.path.join(self.path, f"t-{n}.bin"), "rb") as f:
+                data = _read_u32(f.read())
+            count = data[0]
+            base = start = 1 + 2 * count
+            for code, end in zip(data[1:1 + count], data[1 + count:base]):
+                self.postings[code] = data[start:base + end]
+                start = base + end
+        self._blocks = {}
+
+    def doc(self, i):
+        """[name, path] (printers: [name, path, cartridge doc ids]) of doc `i`."""
+        block = self._blocks.get(i // self.block)
+        if block is None:
+            with open(os.path.join(self.path, f"d-{i // self.block}.json"), encoding="utf-8") as f:
+                block = self._blocks[i // self.block] = json.load(f)
+        return block[i % self.block]
+
+    def search(self, query, k=None):
+        """Top `k` cartridges for `query` -> [{"name", "url", "words", "score", "via"}], best first.
+
+        Docs rank by "words", the number of query words they contain whole (every trigram
+        of the word, the last one as a prefix: "63" in "HP 63XL"), then by trigram score,
+        so a model number beats a long printer name that only shares " hp" and " 6".
+        A doc containing every query word is kept whatever its score. "via" is the
+        printer whose name matched, or None for a direct title/SKU match.
+        """
+        words = lookup_words(query)
+        word_codes = [frozenset(_word_trigrams(w, i < len(words) - 1)) for i, w in enumerate(words)]
+        codes = frozenset().union(*word_codes)
+        if not codes:
+            return []
+        hits = collections.Counter()
+        for code in codes:
+            hits.update(self.postings.get(code, ()))
+        weight, lens, kinds, min_score = self.length_weight, self.lens, self.kinds, self.min_score
+        n_by_kind = (len(codes - self.stops[0]), len(codes - self.stops[1]))  # printers, cartridges
+        if not any(n_by_kind):
+            return []
+        need = max(1, math.ceil(min_score * min(n for n in n_by_kind if n)))  # score <= hits / n
+
+        # whole words; a word made only of a kind's stop trigrams counts for every doc of that kind
+        matched, base = collections.Counter(), [0, 0]
+        for wcodes in word_codes:
+            full = (len(wcodes - self.stops[0]), len(wcodes - self.stops[1]))
+            for kind in (0, 1):
+                base[kind] += not full[kind]
+            word_hits = collections.Counter()
+            for code in wcodes:
+                word_hits.update(self.postings.get(code, ()))
+            for doc, h in word_hits.items():
+                if h == full[kinds[doc]]:
+                    matched[doc] += 1
+
+        ranks = {}  # doc -> (words, score)
+        for doc, h in hits.items():
+            if h >= need:
+                kind = kinds[doc]
+                score = h / (n_by_kind[kind] + (lens[doc] - h) * weight)
+                n_words = matched[doc] + base[kind]
+                if score >= min_score or n_words == len(words):
+                    ranks[doc] = (n_words, score)
+
+        best = {doc: rank for doc, rank in ranks.items() if kinds[doc]}
+        via = {}
+        printers = heapq.nsmallest(self.top_printers, (d for d in ranks if not kinds[d]),
+                                   key=lambda d: (-ranks[d][0], -ranks[d][1], d))
+        for printer in printers:
+            rank = ranks[printer]
+            for doc in self.doc(printer)[2]:
+                if rank > best.get(doc, (0, 0)):
+                    best[doc], via[doc] = rank, printer
+        return [
+            {"name": self.doc(d)[0], "url": f"{self.base_url}/{self.doc(d)[1]}/", "words": best[d][0],
+             "score": round(best[d][1], 4), "via": self.doc(via[d])[0] if d in via else None}
+            for d in heapq.nsmallest(k or LOOKUP_TOP_K, best, key=lambda d: (-best[d][0], -best[d][1], d))
+        ]
+
+# -------- Validation + row diff (one streaming pass per catalog, no rendering) --------
+
+def row_hash(row, prior=""):
+    # row content in column order, chained like page_digest() so every row sharing a
+    # key counts; blake2b is the fastest hashlib digest here
+    text = prior + "\x1e" + "\x1f".join(str(v) for v in row.values())
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+def validate_catalog(site, catalog, rows, prev_hashes=None):
+    """Check one catalog's rows in a single pass -> report dict (plus "hashes" for the snapshot).
+
+    Errors: missing columns, rows without a name, unparseable or negative price/yield.
+    Warnings: duplicate SKUs (the last row wins), different SKUs whose slugs collide
+    (they get -2, -3 … suffixes), cost per page outside CPP_RANGE.
+    The diff compares each row's content hash with `prev_hashes` from the last build.
+    """
+    issues = {}
+
+    def issue(level, kind, n, message):
+        entry = issues.setdefault(kind, {"level": level, "count": 0, "samples": []})
+        entry["count"] += 1
+        if len(entry["samples"]) < site.VALIDATE_SAMPLES:
+            entry["samples"].append(f"row {n}: {message}")
+
+    hashes, first_row, slug_owner = {}, {}, {}
+    n = 0
+    for n, row in enumerate(rows, 1):
+        if n == 1:
+            missing = [c for c in site.REQUIRED_COLUMNS if c not in row]
+            if missing:
+                issue("error", "missing_columns", n, ", ".join(missing))
+        name = (row.get("product_name") or "").strip()
+        if not name:
+            issue("error", "missing_name", n, "empty product_name")
+
+        values = {}
+        for column, parse in (("price", safe_float), ("page_yield", safe_int)):
+            raw = (row.get(column) or "").strip()
+            value = parse(raw)
+            if raw and value is None:
+                issue("error", f"bad_{column}", n, f"{column}={raw!r} is not a number")
+            elif value is not None and value <= 0:
+                issue("error", f"bad_{column}", n, f"{column}={raw} must be positive")
+                value = None
+            values[column] = value
+        if values["price"] and values["page_yield"]:
+            cpp = values["price"] / values["page_yield"]
+            if not site.CPP_RANGE[0] <= cpp <= site.CPP_RANGE[1]:
+                issue("warning", "cpp_outlier", n, f"{name}: cost per page {cents_str(cpp)} "
+                      f"(price {values['price']}, yield {values['page_yield']})")
+
+        key = SlugRegistry.key_for(row)
+        if key in first_row:
+            issue("warning", "duplicate_sku", n, f"{key.split(':', 1)[1]} also on row {first_row[key]} (last row wins)")
+        else:
+            first_row[key] = n
+            slug = row_slug(row)
+            other = slug_owner.setdefault(slug, key)
+            if other != key:
+                issue("warning", "slug_collision", n, f"{key.split(':', 1)[1]} and {other.split(':', 1)[1]} "
+                      f"both slugify to {slug!r}")
+        hashes[key] = row_hash(row, hashes.get(key, ""))
+
+    report = {"section": catalog["section"], "csv": catalog["csv"], "rows": n, "issues": issues}
+    if prev_hashes is not None:
+        added = [k for k in hashes if k not in prev_hashes]
+        removed = [k for k in prev_hashes if k not in hashes]
+        changed = [k for k, h in hashes.items() if k in prev_hashes and prev_hashes[k] != h]
+        report["diff"] = {
+            "added": len(added), "removed": len(removed), "changed": len(changed),
+            "unchanged": len(hashes) - len(added) - len(changed),
+            "samples": {"added": added[:site.VALIDATE_SAMPLES], "removed": removed[:site.VALIDATE_SAMPLES],
+                        "changed": changed[:site.VALIDATE_SAMPLES]},
+        }
+    report["hashes"] = hashes
+    return report
+
+def validate_catalogs(site, catalogs, read_rows):
+    """validate_catalog() for every catalog, diffed against ROWS_SNAPSHOT if there is one."""
+    previous = load_rows_snapshot(site.ROWS_SNAPSHOT)
+    return [validate_catalog(site, c, read_rows(c), None if previous is None else previous.get(c["section"], {}))
+            for c in catalogs]
+
+def load_rows_snapshot(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("sections", {})
+    except (OSError, ValueError):
+        return None
+
+def save_rows_snapshot(site, path, reports):
+    sections = {r["section"]: r["hashes"] for r in reports}
+    write_text(site, path, json.dumps({"sections": sections}, sort_keys=True, separators=(",", ":")))
+
+def log_validation(site, reports, verbose=False):
+    """Log issue counts (and with `verbose`, example rows + the row diff) -> number of errors."""
+    errors = 0
+    for r in reports:
+        for kind, entry in sorted(r["issues"].items()):
+            errors += entry["count"] if entry["level"] == "error" else 0
+            emit = log.error if entry["level"] == "error" else log.warning
+            emit(f"[{r['section']}] {entry['count']} {entry['level']}(s) {kind}")
+            if verbose:
+                for sample in entry["samples"]:
+                    emit(f"    {sample}")
+        if verbose:
+            diff = r.get("diff")
+            if diff is None:
+                log.info(f"[{r['section']}] {r['rows']} rows checked; "
+                         f"no previous snapshot ({site.ROWS_SNAPSHOT}) to diff against")
+                continue
+            log.info(f"[{r['section']}] {r['rows']} rows: {diff['added']} added, {diff['changed']} changed, "
+                     f"{diff['removed']} removed, {diff['unchanged']} unchanged since the last build")
+            for bucket, keys in diff["samples"].items():
+                if keys:
+                    log.info(f"    {bucket}: {', '.join(k.split(':', 1)[1] for k in keys)}"
+                             f"{' …' if diff[bucket] > len(keys) else ''}")
+    return errors
+
+# -------- Output verification (--verify: links, canonicals, JSON-LD, sitemap, orphans) --------
+# literal-prefixed, so re scans for 'href="' fast; an (href|src) alternation is ~8x slower
+# and the templates have no src= (images, scripts) of their own
+_HREF = re.compile(rb'href="([^"#][^"]*)"')
+_CANONICAL = b'<link rel="canonical" href="'
+_JSON_LD = b'<script type="application/ld+json">'
+_SITEMAP_LOC = re.compile(rb"<loc>([^<]*)</loc>")
+_URL_SCHEME = re.compile(r"[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+def output_index(root=None):
+    """Relative "/"-separated path of every file under `root` (temp files left out)."""
+    files, dirs = set(), [("", root or OUTPUT_DIR)]
+    while dirs:  # scandir, not os.walk: no relpath() or extra stat per directory
+        prefix, path = dirs.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append((prefix + entry.name + "/", entry.path))
+                elif not entry.name.startswith(".tmp-"):
+                    files.add(prefix + entry.name)
+    return files
+
+def url_to_file(url, files, base_url=None):
+    """The file in `files` that serves absolute `url`: None if the URL is outside
+    base_url (external), False if it's ours but nothing serves it."""
+    base = (BASE_URL if base_url is None else base_url) + "/"
+    url = url.partition("#")[0].partition("?")[0]
+    if url + "/" == base:
+        url = base
+    if not url.startswith(base):
+        return None
+    path = urllib.parse.unquote(url[len(base):])
+    if not path or path.endswith("/"):
+        path += "index.html"
+    elif path not in files and path + "/index.html" in files:
+        path += "/index.html"  # GitHub Pages redirects /dir to /dir/
+    return path if path in files else False
+
+def check_json_ld(text):
+    """Problems in one JSON-LD block of our templates -> ([(kind, message)], [URLs it references])."""
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        return [("json_ld_syntax", str(e))], []
+    if not isinstance(data, dict) or data.get("@context") not in ("https://schema.org", "http://schema.org"):
+        return [("json_ld_context", "not a schema.org object")], []
+    issues, urls, kind = [], [], data.get("@type")
+    if kind == "Product":
+        if not data.get("name"):
+            issues.append(("json_ld_product", "Product without a name"))
+        offers = data.get("offers")
+        if offers:
+            price = offers.get("lowPrice" if offers.get("@type") == "AggregateOffer" else "price")
+            if not (safe_float(price) or 0) > 0 or not offers.get("priceCurrency"):
+                issues.append(("json_ld_product", f"offer price {price!r} {offers.get('priceCurrency')!r}"))
+        if data.get("url"):
+            urls.append(data["url"])
+    elif kind == "FAQPage":
+        questions = data.get("mainEntity") or []
+        if not questions:
+            issues.append(("json_ld_faq", "FAQPage without questions"))
+        for q in questions:
+            if not (q.get("@type") == "Question" and q.get("name") and (q.get("acceptedAnswer") or {}).get("text")):
+                issues.append(("json_ld_faq", f"incomplete Question {q.get('name')!r}"))
+    elif kind in ("BreadcrumbList", "ItemList"):
+        # breadcrumbs link through "item", the printer pages' cartridge lists through "url"
+        items, field = data.get("itemListElement") or [], "item" if kind == "BreadcrumbList" else "url"
+        if [item.get("position") for item in items] != list(range(1, len(items) + 1)):
+            issues.append((f"json_ld_{kind.lower()}", "positions are not 1..n"))
+        for item in items:
+            if not (item.get("name") and isinstance(item.get(field), str) and item[field]):
+                issues.append((f"json_ld_{kind.lower()}", f"ListItem {item.get('position')} without a name or {field}"))
+            else:
+                urls.append(item[field])
+    else:
+        issues.append(("json_ld_type", f"unexpected @type {kind!r}"))
+    return issues, urls
+
+def _scan_pages(root, paths):
+    # thread-pool task: a bytes regex and find() over each page, no HTML parser (~80 µs a page)
+    pages = []
+    for path in paths:
+        with open(os.path.join(root, path), "rb") as f:
+            data = f.read()
+        links = set(_HREF.findall(data))  # still bytes: verify_output() decodes each distinct link once
+        canonical = None
+        i = data.find(_CANONICAL)
+        if i >= 0:
+            i += len(_CANONICAL)
+            canonical = data[i:data.find(b'"', i)]
+        ld_issues, ld_urls = [], []
+        i = data.find(_JSON_LD)
+        while i >= 0:
+            end = data.find(b"</script>", i)
+            issues, urls = check_json_ld(data[i + len(_JSON_LD):end if end >= 0 else len(data)])
+            ld_issues += issues
+            ld_urls += urls
+            i = data.find(_JSON_LD, end) if end >= 0 else -1
+        pages.append((path, links, canonical, ld_issues, ld_urls))
+    return pages
+
+def _sitemap_locs(root, name):
+    with open(os.path.join(root, name), "rb") as f:
+        data = f.read()
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+    return [html_unescape(loc.decode("utf-8").strip()) for loc in _SITEMAP_LOC.findall(data)]
+
+def verify_output(root=None, base_url=None, threads=None):
+    """Check the built site in `root` (default OUTPUT_DIR) -> report dict.
+
+    Every .html page is scanned on a bounded thread pool. Its hrefs, its canonical and
+    the URLs in its JSON-LD must resolve to a file through the URL -> file index of the
+    tree, and the canonical must be the page itself. The Product, FAQPage,
+    BreadcrumbList and ItemList JSON-LD blocks must parse and carry their required
+    fields. Sitemap entries must resolve too.
+    Errors: broken links, canonicals, JSON-LD and sitemap URLs. Warnings: missing
+    canonicals, and orphan pages no other page links to (e.g. left behind by a renamed
+    slug, or copied in by hand).
+    """
+    t0 = time.perf_counter()
+    root = root or OUTPUT_DIR
+    base = BASE_URL if base_url is None else base_url
+    files = output_index(root)
+    pages = sorted(p for p in files if p.endswith(".html"))
+    issues = {}
+
+    def issue(level, kind, where, message):
+        entry = issues.setdefault(kind, {"level": level, "count": 0, "samples": []})
+        entry["count"] += 1
+        if len(entry["samples"]) < VALIDATE_SAMPLES:
+            entry["samples"].append(f"{where}: {message}")
+
+    # link as found (bytes from pages, str from JSON-LD / sitemaps) -> file it resolves to,
+    # "" if external, False if broken; relative links depend on the page and aren't cached
+    resolved, linked, in_sitemap, n_links = {}, set(), set(), 0
+    def resolve(link, page_url):
+        target = resolved.get(link)
+        if target is None:
+            url = link.decode("utf-8", "replace") if isinstance(link, bytes) else link
+            url = html_unescape(url) if "&" in url else url
+            if url.startswith(("http://", "https://")):
+                target = resolved[link] = url_to_file(url, files, base)
+            elif "${" in url:
+                target = ""  # a JS template string in an inline script
+            elif _URL_SCHEME.match(url):
+                target = ""  # mailto:, javascript:, data:
+            else:
+                target = url_to_file(urllib.parse.urljoin(page_url, url), files, base)
+            if target is None:
+                target = resolved[link] = ""
+        return target
+    def resolve_all(links, page_url):
+        # ~25 links a page, mostly the same few thousand URLs: look them up in bulk
+        targets = set(map(resolved.get, links))
+        if None in targets:
+            for link in links:
+                if link not in resolved:
+                    resolve(link, page_url)
+            targets = set(map(resolved.get, links))
+            if None in targets:  # relative links
+                targets = {resolve(link, page_url) for link in links}
+        return targets
+    def text(link):
+        return link.decode("utf-8", "replace") if isinstance(link, bytes) else link
+
+    from concurrent.futures import ThreadPoolExecutor
+    chunks = [pages[i:i + VERIFY_CHUNK] for i in range(0, len(pages), VERIFY_CHUNK)]
+    with ThreadPoolExecutor(max_workers=threads or VERIFY_THREADS) as pool:
+        for batch in pool.map(functools.partial(_scan_pages, root), chunks):
+            for path, links, canonical, ld_issues, ld_urls in batch:
+                page_url = f"{base}/{path[:-len('index.html')] if path.endswith('index.html') else path}"
+                targets = resolve_all(links, page_url)
+                if False in targets:
+                    for link in links:
+                        if resolve(link, page_url) is False:
+                            issue("error", "broken_link", path, text(link))
+                targets.discard(path)
+                linked |= targets
+                n_links += len(links) + len(ld_urls)
+                if canonical is None:
+                    issue("warning", "missing_canonical", path, "no <link rel=canonical>")
+                else:
+                    target = resolve(canonical, page_url)
+                    if target is False:
+                        issue("error", "broken_canonical", path, text(canonical))
+                    elif target != path:
+                        issue("error", "wrong_canonical", path, f"{text(canonical)} is another page")
+                for kind, message in ld_issues:
+                    issue("error", kind, path, message)
+                if False in resolve_all(ld_urls, page_url):
+                    for url in ld_urls:
+                        if resolve(url, page_url) is False:
+                            issue("error", "broken_json_ld_url", path, url)
+
+    if "sitemap_index.xml" not in files:
+        issue("error", "missing_sitemap", root, "no sitemap_index.xml")
+    else:
+        for loc in _sitemap_locs(root, "sitemap_index.xml"):
+            shard = resolve(loc, base + "/")
+            if shard is False:
+                issue("error", "broken_sitemap_url", "sitemap_index.xml", loc)
+            for url in _sitemap_locs(root, shard) if shard else ():
+                n_links += 1
+                target = resolve(url, base + "/")
+                if target is False:
+                    issue("error", "broken_sitemap_url", shard, url)
+                in_sitemap.add(target)
+
+    for path in pages:
+        if path not in linked and path != "index.html":
+            issue("warning", "orphan_page", path,
+                  "no page links here" + ("" if path in in_sitemap else ", and it's not in the sitemap"))
+    return {"root": root, "files": len(files), "pages": len(pages), "links": n_links,
+            "seconds": round(time.perf_counter() - t0, 2), "issues": issues}
+
+def log_verification(report):
+    """Log the issue counts + samples of a verify_output() report -> number of errors."""
+    errors = 0
+    for kind, entry in sorted(report["issues"].items()):
+        errors += entry["count"] if entry["level"] == "error" else 0
+        emit = log.error if entry["level"] == "error" else log.warning
+        emit(f"[verify] {entry['count']} {entry['level']}(s) {kind}")
+        for sample in entry["samples"]:
+            emit(f"    {sample}")
+    log.info(f"Verified {report['links']:,} links on {report['pages']:,} pages ({report['files']:,} files) "
+             f"in ./{report['root']} in {report['seconds']}s: {errors} errors")
+    return errors
+
+def parse_catalog(site, spec):
+    # "ink=data/printer_cartridges.csv" or "ink=data/ink.csv,ink_template.html"
+    section, sep, rest = spec.partition("=")
+    csv_path, _, template = rest.partition(",")
+    if not sep or not section or not csv_path:
+        raise SystemExit(f"--catalog expects SECTION=CSV[,TEMPLATE], got {spec!r}")
+    return {"section": section, "csv": csv_path, "template": template or site.TEMPLATE_FILE}
+
+def parse_args(argv=None, site=None):
+    site = site or Site()  # defaults and help text come from this site's settings
+    parser = argparse.ArgumentParser(description=f"Build the {site.SITE_NAME} static site into ./{site.OUTPUT_DIR}")
+    parser.add_argument("--catalog", action="append", metavar="SECTION=CSV[,TEMPLATE]",
+                        help="build this catalog (repeatable; replaces CATALOGS / DATA_CSV), "
+                             f"TEMPLATE defaults to {site.TEMPLATE_FILE}")
+    parser.add_argument("--validate", action="store_true",
+                        help="only check the catalogs and diff them against the last build, then exit "
+                             "(status 1 on errors); nothing is rendered")
+    parser.add_argument("--lookup", metavar="QUERY",
+                        help=f"print the best cartridges for a printer or SKU from the last build's "
+                             f"./{site.OUTPUT_DIR}/{site.LOOKUP_DIR}/ index, then exit")
+    parser.add_argument("--strict", action="store_true",
+                        help="stop the build if validation finds errors")
+    parser.add_argument("--verify", action="store_true",
+                        help="after the build, check every internal link, canonical, JSON-LD block and "
+                             f"sitemap entry in ./{site.OUTPUT_DIR} and list orphan pages (status 1 on errors)")
+    parser.add_argument("--check", action="store_true",
+                        help="dry run: list the pages a build would add, change or remove, from the "
+                             "manifest and build cache (status 1 if any); nothing is rendered or written")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the build manifest and re-render every page")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"don't read or update the {site.BUILD_CACHE} page cache")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="render pages in N worker processes (default: 1)")
+    parser.add_argument("--gzip-sitemaps", action="store_true", default=site.SITEMAP_GZIP,
+                        help="write gzip-compressed sitemap shards")
+    parser.add_argument("--minify", action="store_true", default=site.MINIFY_HTML,
+                        help="minify HTML pages, including inline CSS, JS and JSON-LD")
+    parser.add_argument("--precompress", action="store_true", default=site.PRECOMPRESS,
+                        help="write .gz (and .br if brotli is installed) next to changed outputs")
+    parser.add_argument("--external-css", action="store_true", default=site.EXTERNAL_CSS,
+                        help=f"link a hashed {site.ASSETS_DIR}/site-<hash>.css instead of inlining the page CSS")
+    parser.add_argument("--profile", nargs="?", const=site.PROFILE_REPORT, metavar="PATH",
+                        help=f"time each build stage and write a JSON report (default: {site.PROFILE_REPORT})")
+    parser.add_argument("--watch", action="store_true",
+                        help=f"serve ./{site.OUTPUT_DIR} locally and rebuild when data or templates change")
+    parser.add_argument("--port", type=int, default=site.WATCH_PORT,
+                        help=f"--watch dev server port (default: {site.WATCH_PORT})")
+    parser.add_argument("--log-level", default="INFO", type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="DEBUG also logs every affiliate offer (default: INFO)")
+    return parser.parse_args(argv)
+
+def reset_build_state(site, args):
+    # per-build accumulators, so --watch can run build() again with the same site
+    site.MINIFY_HTML = args.minify
+    site.pages_by_section.clear()
+    site.search_index.clear()
+    site.section_rendered.clear()
+    for k in site.write_stats:
+        site.write_stats[k] = 0
+    site.profile = {} if args.profile else None
+    site.slowest_pages = []
+
+def build(site, args, read_rows=None):
+    """One full (incremental) site build; `read_rows(catalog)` defaults to streaming its CSV.
+
+    Returns a summary: {"pages": render stats, "printer_pages", "lookup_docs", "written",
+    "precompressed", "seconds"}.
+    """
+    reset_build_state(site, args)
+    read_rows = read_rows or (lambda c: timed_iter(site, iter_rows(c["csv"], row_limit=site.ROW_LIMIT), "load_rows"))
+    t_start = time.perf_counter()
+    os.makedirs(site.OUTPUT_DIR, exist_ok=True)
+
+    # Validate every catalog before rendering anything
+    catalogs = catalog_list(site)
+    with stage(site, "validate"):
+        validation = validate_catalogs(site, catalogs, read_rows)
+    if log_validation(site, validation) and args.strict:
+        raise SystemExit("validation failed (--strict); run with --validate for details")
+
+    # Load optional offers mapping once (kept from the last build while offers.csv is unchanged)
+    site.offers_by_sku = load_offers(site, site.AFFILIATE_OFFERS_CSV, current=site.offers_by_sku)
+    if site.offers_by_sku:
+        log.debug(f"[debug] loaded {site.offers_by_sku.n_offers} offers for {len(site.offers_by_sku)} SKUs "
+                  f"from {site.AFFILIATE_OFFERS_CSV}")
+    else:
+        log.debug("[debug] no offers.csv found")
+
+    # Static parts of the page template, rendered once for every page of this build
+    with stage(site, "build_page_fragments"):
+        site.page_fragments = build_page_fragments(site, external_css=args.external_css)
+
+    # Stream every catalog's rows -> render (unchanged pages are skipped unless --full)
+    printer_digests = {}
+    manifests = load_manifest(site, site.BUILD_MANIFEST, printers=printer_digests)
+    slugs = load_slug_registry(site, site.SLUG_REGISTRY)
+    cache = None if args.no_cache else open_build_cache(site, site.BUILD_CACHE)
+    with stage(site, "render_pages"):
+        manifests, stats = render_pages(site, catalogs, read_rows, manifests, force=args.full,
+                                        jobs=args.jobs, slugs=slugs, cache=cache)
+    if cache is not None:
+        with stage(site, "build_cache"):
+            cache.close()
+        if cache.evicted:
+            log.debug(f"[debug] evicted {cache.evicted} pages from {site.BUILD_CACHE} (over {cache.max_bytes:,} bytes)")
+    save_rows_snapshot(site, site.ROWS_SNAPSHOT, validation)
+    for c in catalogs:
+        log.debug(f"[debug] recorded {len(site.pages_by_section.get(c['section'], []))} pages from {c['csv']}")
+
+    # Printer pages from the reverse index built during render_pages()
+    with stage(site, "build_printer_pages"):
+        printer_entries = build_printer_pages(site, manifests, printer_digests, force=args.full, jobs=args.jobs,
+                                              slugs=slugs)
+    save_manifest(site, site.BUILD_MANIFEST, manifests, printer_digests)
+    save_slug_registry(site, site.SLUG_REGISTRY, slugs)
+
+    # Build indexes + static files from the compact page records
+    with stage(site, "build_lookup_index"):
+        lookup_docs = build_lookup_index(site, manifests)
+
+    # Listing pages carry the newest lastmod of what they list, not today's date,
+    # so a build that changed nothing rewrites nothing
+    lastmods = {section: {e["url"]: e["lastmod"] for e in manifests[section].values()}
+                for section in [c["section"] for c in catalogs]}
+    lastmods[site.PRINTER_SECTION] = dict(printer_entries)
+    site_lastmod = max((max(urls.values()) for urls in lastmods.values() if urls), default=None)
+    with stage(site, "build_section_index"):
+        for section, urls in lastmods.items():
+            build_section_index(site, section, lastmods=urls, ids=slugs[section].ids(),
+                                rendered=site.section_rendered.setdefault(section, {}))
+    with stage(site, "build_homepage_full"):
+        build_homepage_full(site, last_updated=site_lastmod)
+    with stage(site, "build_sitemap"):
+        build_sitemap(site, itertools.chain(
+            ((url, manifests[c["section"]][slug]["lastmod"])
+             for c in catalogs for slug, _title, url in site.pages_by_section.get(c["section"], [])),
+            printer_entries,
+        ), compress=args.gzip_sitemaps, home_lastmod=site_lastmod)
+    build_robots(site)
+    compressed = None
+    if args.precompress:
+        with stage(site, "precompress"):
+            compressed = precompress_outputs(site, threads=max(args.jobs, site.PRECOMPRESS_THREADS))
+    for c in catalogs:
+        log.info(f"Generated {len(site.pages_by_section.get(c['section'], []))} pages "
+                 f"into ./{site.OUTPUT_DIR}/{c['section']} from {c['csv']}")
+    log.info(f"{stats['rendered']} pages rendered, {stats['cached']} from the build cache, "
+             f"{stats['skipped']} skipped, {stats['removed']} removed")
+    collisions = sum(registry.collisions for registry in slugs.values())
+    if collisions:
+        log.warning(f"{collisions} slug collisions disambiguated (see {site.SLUG_REGISTRY})")
+    log.info(f"Generated {len(printer_entries)} printer pages into ./{site.OUTPUT_DIR}/{site.PRINTER_SECTION}")
+    log.info(f"Indexed {lookup_docs} printers + cartridges for lookup into ./{site.OUTPUT_DIR}/{site.LOOKUP_DIR}")
+    log.info(f"Wrote {site.write_stats['bytes']:,} bytes to {site.write_stats['written']} files "
+             f"({site.write_stats['unchanged']} unchanged files left untouched)")
+    if site.MINIFY_HTML and site.write_stats["html_in"]:
+        log.info(f"Minified HTML: {site.write_stats['html_in']:,} -> {site.write_stats['html_out']:,} bytes "
+                 f"({1 - site.write_stats['html_out'] / site.write_stats['html_in']:.1%} smaller)")
+    if compressed:
+        br = f", .br {compressed['br']:,}" if brotli is not None else " (no brotli module: .gz only)"
+        log.info(f"Precompressed {compressed['compressed']} of {compressed['files']} files: "
+                 f"raw {compressed['raw']:,} bytes -> .gz {compressed['gz']:,}{br}")
+
+    summary = {
+        "pages": stats,
+        "printer_pages": len(printer_entries),
+        "lookup_docs": lookup_docs,
+        "written": dict(site.write_stats),
+        "precompressed": compressed,
+        "seconds": round(time.perf_counter() - t_start, 3),
+    }
+    if site.profile is not None:
+        write_profile_report(site, args.profile, time.perf_counter() - t_start, {
+            "jobs": args.jobs,
+            "pages": stats,
+            "printer_pages": len(printer_entries),
+            "written": summary["written"],
+            "precompressed": compressed,
+        })
+    return summary
+
+def check_pages(site, args):
+    """--check: what would a build change? -> number of pages it would add, change or remove.
+
+    Uses the same digests as an incremental build, without rendering or writing anything.
+    A page whose inputs changed counts as "changed" when the build cache already holds its
+    new output and that differs from the file on disk (identical output isn't listed), and
+    as "rerender" when only a render can tell. Printer pages, indexes and the sitemap
+    follow from these and aren't listed.
+    """
+    reset_build_state(site, args)
+    catalogs = catalog_list(site)
+    site.offers_by_sku = load_offers(site, site.AFFILIATE_OFFERS_CSV, current=site.offers_by_sku)
+    site.page_fragments = build_page_fragments(site, external_css=args.external_css, write=False)
+    cache = None if args.no_cache else open_build_cache(site, site.BUILD_CACHE, create=False)
+    try:
+        _manifests, stats = render_pages(site, catalogs, lambda c: iter_rows(c["csv"], row_limit=site.ROW_LIMIT),
+                                         load_manifest(site, site.BUILD_MANIFEST),
+                                         slugs=load_slug_registry(site, site.SLUG_REGISTRY), cache=cache, dry_run=True)
+    finally:
+        if cache is not None:
+            cache.close(evict=False)
+    changes = stats["changes"]
+    labels = {"new": "new", "changed": "changed (known from the build cache)",
+              "rerender": "to re-render (inputs changed)", "removed": "removed"}
+    for kind, urls in changes.items():
+        if urls:
+            log.info(f"{len(urls)} pages {labels[kind]}:")
+            for url in urls[:site.VALIDATE_SAMPLES]:
+                log.info(f"  {url}")
+            if len(urls) > site.VALIDATE_SAMPLES:
+                log.info(f"  … and {len(urls) - site.VALIDATE_SAMPLES} more")
+    total = sum(len(urls) for urls in changes.values())
+    log.info(f"{total} pages would change" if total else f"All {stats['pages']} pages are up to date")
+    return total
+
+# -------- Watch mode (--watch): local dev server + in-process rebuilds --------
+WATCH_PORT = 8000
+WATCH_INTERVAL = 0.5  # seconds between polls of the watched files
+
+def cached_rows(site, csv_path):
+    """Parsed rows of `csv_path`, kept in memory and re-read only after the file changes."""
+    st = os.stat(csv_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = site.row_cache.get(csv_path)
+    if hit is None or hit[0] != stamp:
+        hit = site.row_cache[csv_path] = (stamp, list(iter_rows(csv_path, row_limit=site.ROW_LIMIT)))
+    return hit[1]
+
+def watched_files(site):
+    """{path: (mtime_ns, size)} for the templates, the catalog CSVs' directories and offers.csv."""
+    roots = {site.TEMPLATE_DIR} | {os.path.dirname(c["csv"]) or "." for c in catalog_list(site)}
+    stamps = {}
+    for root in sorted(roots):
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.startswith("."):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue  # deleted mid-walk
+                    stamps[path] = (st.st_mtime_ns, st.st_size)
+    if os.path.exists(site.AFFILIATE_OFFERS_CSV):
+        st = os.stat(site.AFFILIATE_OFFERS_CSV)
+        stamps[site.AFFILIATE_OFFERS_CSV] = (st.st_mtime_ns, st.st_size)
+    return stamps
+
+def serve_output(site, port):
+    """Serve OUTPUT_DIR on localhost in a background thread -> the server (call .shutdown()).
+
+    Pages link with absolute BASE_URL URLs, so text responses have BASE_URL swapped for
+    the local address on the way out; the files on disk keep the real URLs.
+    """
+    local = f"http://localhost:{port}".encode("utf-8")
+    base = site.BASE_URL.encode("utf-8")
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *a, **kw):
+            super().__init__(*a, directory=site.OUTPUT_DIR, **kw)
+
+        def send_head(self):
+            path = self.translate_path(self.path)
+            if os.path.isdir(path) and self.path.split("?")[0].endswith("/"):
+                path = os.path.join(path, "index.html")
+            if not (os.path.isfile(path) and path.endswith((".html", ".xml", ".json", ".txt"))):
+                return super().send_head()  # directory redirects, assets, 404s
+            with open(path, "rb") as f:
+                body = f.read().replace(base, local)
+            self.send_response(200)
+            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            return io.BytesIO(body)
+
+        def log_message(self, fmt, *a):
+            log.debug("[http] " + fmt, *a)
+
+    server = ThreadingHTTPServer(("localhost", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class WatchSession:
+    """What --watch keeps in memory between rebuilds, so a CSV edit costs milliseconds.
+
+    full() runs build() and keeps its results: the manifest, slug registry and row
+    hashes, plus every page's rows, row digest, title and printers. update() re-reads
+    the changed catalog CSVs (cached_rows), diffs their rows page by page against those,
+    and redoes only what the changed pages feed:
+      - the changed pages, and the pages sharing a printer with them when a title or
+        printer list changed (their related lists may have moved);
+      - those pages' printer pages, the index pages whose cards or dates changed, the
+        sitemap and the homepage;
+      - the search files when a page's words changed, the lookup index when a title or
+        printer list changed.
+    Any other change (templates, offers.csv) is a full() rebuild. --precompress only
+    applies to full rebuilds; a rewritten page just loses its stale .gz/.br siblings.
+    """
+
+    def __init__(self, site, args):
+        self.site = site
+        self.args = args
+        self.catalogs = []  # none until full(): every change rebuilds
+
+    def read_rows(self, catalog):
+        return iter(cached_rows(self.site, catalog["csv"]))
+
+    def full(self):
+        site = self.site
+        build(site, self.args, self.read_rows)
+        self.catalogs = catalog_list(site)
+        self.printer_digests = {}
+        self.manifests = load_manifest(site, site.BUILD_MANIFEST, printers=self.printer_digests)
+        self.slugs = load_slug_registry(site, site.SLUG_REGISTRY)
+        self.row_hashes = load_rows_snapshot(site.ROWS_SNAPSHOT) or {}
+        self.cfg_digests = {c["section"]: config_digest(site, c["section"], c["template"]) for c in self.catalogs}
+        self.groups, self.digests, self.titles, self.models_by_page = {}, {}, {}, {}
+        for catalog in self.catalogs:
+            section = catalog["section"]
+            self.groups[section] = self._group(section, cached_rows(site, catalog["csv"]))
+            for slug, rows in self.groups[section].items():
+                self._read_page((section, slug), rows)
+
+    def _group(self, section, rows):
+        # {slug: [rows]}, in first-row order like render_pages() pass 1; the last row owns the page
+        assign, groups = self.slugs[section].assign, {}
+        for row in rows:
+            groups.setdefault(assign(row), []).append(row)
+        return groups
+
+    def _read_page(self, page, rows):
+        digest = ""
+        for row in rows:
+            digest = page_digest(self.site, row, digest)
+        self.digests[page] = digest
+        self.titles[page] = (rows[-1].get("product_name") or "").strip()
+        self.models_by_page[page] = parse_compatible_models(rows[-1].get("compatible_models"))
+
+    def update(self, changed_paths):
+        """Rebuild for `changed_paths` -> False if that took a full() build."""
+        by_csv = {os.path.normpath(c["csv"]): c for c in self.catalogs}
+        catalogs = [by_csv.get(os.path.normpath(p)) for p in changed_paths]
+        if not all(catalogs):
+            self.full()
+            return False
+        try:
+            self._update(catalogs)
+        except Exception:
+            self.catalogs = []  # the state may be half-updated: rebuild everything on the next change
+            raise
+        return True
+
+    def _update(self, catalogs):
+        site = self.site
+        for k in site.write_stats:
+            site.write_stats[k] = 0
+
+        # diff each changed catalog's pages against the last rebuild; validate just the changed rows
+        diffs, reports = [], []
+        for catalog in catalogs:
+            section = catalog["section"]
+            rows = cached_rows(site, catalog["csv"])
+            old, new = self.groups[section], self._group(section, rows)
+            changed = [slug for slug, group in new.items() if old.get(slug) != group]
+            removed = [slug for slug in old if slug not in new]
+            diffs.append((section, rows, old, new, changed, removed))
+            reports.append(validate_catalog(site, catalog, [row for slug in changed for row in new[slug]]))
+        if log_validation(site, reports) and self.args.strict:
+            log.error("validation failed (--strict); fix the rows above to rebuild")
+            return
+
+        today = today_iso()
+        touched, printers_hit = set(), set()  # pages to re-check, printers whose cartridge lists moved
+        structural, search_sections, listed = False, set(), False  # listed: sitemap URLs came, went or moved
+        for section, rows, old, new, changed, removed in diffs:
+            self.groups[section] = new
+            hashes = self.row_hashes.setdefault(section, {})
+            page_ids = self.slugs[section].ids()
+            for slug in removed:
+                page, row = (section, slug), old[slug][-1]
+                structural = True
+                printers_hit.update(printer_keys(self.models_by_page.pop(page)))
+                unindex_search_tokens(site, section, page_ids[slug], row)
+                hashes.pop(SlugRegistry.key_for(row), None)
+                del self.digests[page], self.titles[page]
+                self.manifests[section].pop(slug, None)
+                remove_page(site, section, slug)
+                search_sections.add(section)
+            for slug in changed:
+                page, group = (section, slug), new[slug]
+                before = (self.titles.get(page), self.models_by_page.get(page))
+                self._read_page(page, group)
+                if before != (self.titles[page], self.models_by_page[page]):
+                    structural = True
+                    printers_hit.update(printer_keys(before[1] or []))
+                    printers_hit.update(printer_keys(self.models_by_page[page]))
+                if slug not in old or before[0] != self.titles[page] or \
+                        search_tokens(old[slug][-1]) != search_tokens(group[-1]):
+                    if slug in old:
+                        unindex_search_tokens(site, section, page_ids[slug], old[slug][-1])
+                    index_search_tokens(site, section, page_ids[slug], group[-1])
+                    search_sections.add(section)
+                digest = ""
+                for row in group:
+                    digest = row_hash(row, digest)
+                hashes[SlugRegistry.key_for(group[-1])] = digest
+                touched.add(page)
+            # records at each page's owning (last) row, like render_pages() pass 2
+            last = {}
+            for i, row in enumerate(rows):
+                last[self.slugs[section].assign(row)] = i
+            order = sorted(last, key=last.get)
+            listed = listed or order != [slug for slug, _title, _url in site.pages_by_section.get(section, [])]
+            site.pages_by_section[section] = [(slug, self.titles[(section, slug)], page_url(site, section, slug))
+                                              for slug in order]
+        if not touched and not structural:
+            log.info("No page inputs changed")
+            return
+
+        printers_before = {k: p["name"] for k, p in site.printer_index.items()}
+        if structural:
+            # pass 1's page order, so printer pages list their cartridges as a full build does
+            self.models_by_page = {(c["section"], slug): self.models_by_page[(c["section"], slug)]
+                                   for c in self.catalogs for slug in self.groups[c["section"]]}
+            site.printer_index = build_printer_index(self.models_by_page)
+            for key in printers_hit:
+                touched.update(site.printer_index[key]["pages"] if key in site.printer_index else ())
+        printers_changed = printers_before != {k: p["name"] for k, p in site.printer_index.items()}
+
+        # re-check the touched pages: render (or copy from the cache) the ones whose hash moved
+        cache = None if self.args.no_cache else open_build_cache(site, site.BUILD_CACHE)
+        templates = {c["section"]: c["template"] for c in self.catalogs}
+        items, render_keys, rendered, dates_changed = [], {}, 0, False
+        for page in sorted(touched):
+            section, slug = page
+            related_parts, related_printers = page_related(site, page, self.models_by_page[page], self.titles)
+            prev = self.manifests[section].get(slug, {})
+            entry = self.manifests[section][slug] = manifest_entry(
+                prev, self.digests[page], related_parts, related_printers, self.cfg_digests[section],
+                self.titles[page], page_url(site, section, slug), today)
+            dates_changed = dates_changed or entry["lastmod"] != prev.get("lastmod")
+            path = page_output_path(site, section, slug)
+            if entry["hash"] == prev.get("hash") and os.path.exists(path):
+                continue
+            key = render_key(entry["hash"], section, slug, entry["lastmod"]) if cache is not None else None
+            data = cache.get(key) if key else None
+            if data is not None:
+                _write_bytes(site, path, data)
+                continue
+            render_keys[page] = key
+            items.append((self.groups[section][slug][-1], related_parts, related_printers, slug, section,
+                          templates[section], entry["lastmod"], key is not None))
+        jobs = self.args.jobs if len(items) > site.RENDER_BATCH else 1  # a pool isn't worth it for a few pages
+        for section, slug, _sku, _offers, cached in render_stream(site, items, jobs):
+            if cached:
+                cache.put(render_keys[(section, slug)], *cached)
+            rendered += 1
+        if cache is not None:
+            cache.close()
+
+        # then what lists those pages: printer pages, indexes, search, lookup, homepage, sitemap
+        printer_entries = build_printer_pages(site, self.manifests, self.printer_digests, jobs=self.args.jobs,
+                                              keys=None if printers_changed else printers_hit, slugs=self.slugs)
+        if printers_changed:
+            search_sections.add(site.PRINTER_SECTION)
+        lastmods = {c["section"]: {e["url"]: e["lastmod"] for e in self.manifests[c["section"]].values()}
+                    for c in self.catalogs}
+        lastmods[site.PRINTER_SECTION] = dict(printer_entries)
+        for section, urls in lastmods.items():
+            build_section_index(site, section, lastmods=urls, search=section in search_sections,
+                                ids=self.slugs[section].ids() if section in search_sections else None,
+                                rendered=site.section_rendered.setdefault(section, {}))
+        if structural:
+            build_lookup_index(site, self.manifests)
+        site_lastmod = max((max(urls.values()) for urls in lastmods.values() if urls), default=None)
+        build_homepage_full(site, last_updated=site_lastmod)
+        if listed or printers_changed or dates_changed:
+            build_sitemap(site, itertools.chain(
+                ((url, self.manifests[c["section"]][slug]["lastmod"])
+                 for c in self.catalogs for slug, _title, url in site.pages_by_section.get(c["section"], [])),
+                printer_entries,
+            ), compress=self.args.gzip_sitemaps, home_lastmod=site_lastmod)
+        save_manifest(site, site.BUILD_MANIFEST, self.manifests, self.printer_digests)
+        save_slug_registry(site, site.SLUG_REGISTRY, self.slugs)
+        write_text(site, site.ROWS_SNAPSHOT,
+                   json.dumps({"sections": self.row_hashes}, sort_keys=True, separators=(",", ":")))
+        log.info(f"{len(touched)} pages checked, {rendered} rendered; wrote {site.write_stats['written']} files")
+
+def watch(site, args):
+    """Build, serve OUTPUT_DIR, then rebuild whenever a watched file changes.
+
+    Rows stay parsed in memory (cached_rows) and templates stay compiled in the shared
+    Environment between rebuilds. A change to catalog CSVs only re-renders what the
+    changed rows touch (WatchSession.update); a template or offers change rebuilds,
+    where page digests still skip the pages whose output can't have changed.
+    """
+    session = WatchSession(site, args)
+    session.full()
+    server = serve_output(site, args.port)
+    log.info(f"Serving ./{site.OUTPUT_DIR} at http://localhost:{args.port}/ "
+             "-- watching for changes (Ctrl-C to stop)")
+    seen = watched_files(site)
+    try:
+        while True:
+            time.sleep(site.WATCH_INTERVAL)
+            current = watched_files(site)
+            changed = sorted(p for p in current.keys() | seen.keys() if current.get(p) != seen.get(p))
+            if not changed:
+                continue
+            seen = current
+            log.info(f"Changed: {', '.join(changed)}")
+            t0 = time.perf_counter()
+            try:
+                session.update(changed)
+            except Exception:
+                # e.g. a template syntax error mid-edit: report it and keep watching
+                log.exception("Rebuild failed")
+                continue
+            log.info(f"Rebuilt in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+# -------- Library API (SiteBuilder: one site's config + warm state, many builds per process) --------
+# Files next to the output that hold one site's build state (SiteBuilder(state_dir=…))
+_SITE_STATE_FILES = ("BUILD_MANIFEST", "SLUG_REGISTRY", "ROWS_SNAPSHOT", "BUILD_CACHE", "OFFERS_SNAPSHOT")
+
+class SiteBuilder:
+    """One site to build from Python: its own config and state, kept warm between builds.
+
+        site = SiteBuilder(OUTPUT_DIR="out/ink", BASE_URL="https://ink.example", state_dir="out/.ink",
+                           CATALOGS=[{"section": "ink", "csv": "data/ink.csv", "template": "page_template.html"}])
+        site.build()                  # like `python generate.py`; build(full=True, jobs=4, verify=True), …
+        site.check(); site.validate(); site.lookup("envy 4520")
+
+    `config` overrides any of the module's UPPER_CASE settings for this site only.
+    With `state_dir`, the manifest, slug registry, row snapshot, build cache and
+    offers snapshot live there, so sites don't share them. Nothing is loaded
+    up front. The Jinja environment (compiled templates), the offers snapshot and,
+    with `cache_rows`, the parsed CSV rows are loaded by the first build and reused
+    by the next ones.
+
+    Each builder has its own Site (`.site`), which every build step takes, so
+    builders in different threads build at the same time; the module's settings
+    are left untouched. For parallelism within a build, pass jobs=N: the worker
+    processes get the site's settings in their initializer, forked or spawned.
+    One builder runs one call at a time.
+    """
+
+    def __init__(self, state_dir=None, cache_rows=False, **config):
+        if state_dir is not None:
+            defaults = default_settings()
+            for name in _SITE_STATE_FILES:
+                config.setdefault(name, os.path.join(state_dir, os.path.basename(defaults[name]).lstrip(".")))
+        self.site = Site(**config)
+        self.config = config
+        self.state_dir = state_dir
+        self.cache_rows = cache_rows
+        self._lookup = None
+
+    def _args(self, options):
+        args = parse_args([], Site(**self.config))  # defaults follow this site's config (MINIFY_HTML, …)
+        unknown = [name for name in options if not hasattr(args, name)]
+        if unknown:
+            raise TypeError(f"unknown build option(s): {', '.join(unknown)}")
+        vars(args).update(options)
+        return args
+
+    def _read_rows(self):
+        if self.cache_rows:
+            return lambda catalog: iter(cached_rows(self.site, catalog["csv"]))
+        return None
+
+    def build(self, **options):
+        """Build the site -> build() summary (+ "verify": the verify_output() report with verify=True).
+
+        `options` are the CLI flags by their argparse names: full, jobs, no_cache, strict,
+        minify, precompress, external_css, gzip_sitemaps, profile, verify.
+        """
+        args = self._args(options)
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+        try:
+            summary = build(self.site, args, self._read_rows())
+            if args.verify:
+                summary["verify"] = self.verify()
+        finally:
+            self._lookup = None  # the index may have changed
+        return summary
+
+    def check(self, **options):
+        """--check -> number of pages a build would add, change or remove."""
+        return check_pages(self.site, self._args(options))
+
+    def validate(self):
+        """--validate -> one report per catalog (issues, and the row diff against the last build)."""
+        site = self.site
+        read_rows = self._read_rows() or (lambda c: iter_rows(c["csv"], row_limit=site.ROW_LIMIT))
+        return validate_catalogs(site, catalog_list(site), read_rows)
+
+    def verify(self):
+        """verify_output() of this site's OUTPUT_DIR."""
+        site = self.site
+        return verify_output(site.OUTPUT_DIR, site.BASE_URL, site.VERIFY_THREADS)
+
+    def lookup(self, query, k=None):
+        """FuzzyLookup.search() over this site's last build (the index is loaded once)."""
+        site = self.site
+        if self._lookup is None:
+            self._lookup = FuzzyLookup(os.path.join(site.OUTPUT_DIR, site.LOOKUP_DIR), site.BASE_URL)
+        return self._lookup.search(query, k or site.LOOKUP_TOP_K)
+
+def main(argv=None):
+    site = Site()
+    args = parse_args(argv, site)
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    if args.catalog:
+        site.CATALOGS = [parse_catalog(site, spec) for spec in args.catalog]
+    if args.validate:
+        reports = validate_catalogs(site, catalog_list(site), lambda c: iter_rows(c["csv"], row_limit=site.ROW_LIMIT))
+        sys.exit(1 if log_validation(site, reports, verbose=True) else 0)
+    if args.lookup:
+        t0 = time.perf_counter()
+        lookup = FuzzyLookup(os.path.join(site.OUTPUT_DIR, site.LOOKUP_DIR), site.BASE_URL)
+        hits = lookup.search(args.lookup, site.LOOKUP_TOP_K)
+        for hit in hits:
+            log.info(f"{hit['score']:.2f}  {hit['name']}  {hit['url']}" + (f"  (fits {hit['via']})" if hit["via"] else ""))
+        log.info(f"{len(hits)} matches in {(time.perf_counter() - t0) * 1000:.1f} ms (index load included)")
+        sys.exit(0 if hits else 1)
+    if args.check:
+        sys.exit(1 if check_pages(site, args) else 0)
+    if args.watch:
+        watch(site, args)
+    else:
+        build(site, args)
+        if args.verify:
+            report = verify_output(site.OUTPUT_DIR, site.BASE_URL, site.VERIFY_THREADS)
+            sys.exit(1 if log_verification(report) else 0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,126 @@
+// Fuzzy printer / cartridge lookup over the lookup/ index written by build_lookup_index()
+// in generate.py. Ranks exactly like FuzzyLookup.search there: keep the two in step.
+// Fetches meta.bin once, then only the t-N.bin shards and d-N.json blocks a query needs.
+function createLookup(indexUrl, siteUrl, load) {
+  load = load || (url => fetch(url).then(r => {
+    if (!r.ok) throw new Error(url + ': HTTP ' + r.status);
+    return r.arrayBuffer();
+  }));
+  const file = name => load(indexUrl.replace(/\/?$/, '/') + name);
+  const HEAD = 52;  // "<8sIIIIIIIdd"; the u16/u32 arrays below assume a little-endian host, as every browser is
+  const PRINTER = 0x8000;  // flag on a printer's per-doc u16 (_LOOKUP_PRINTER)
+
+  const meta = file('meta.bin').then(buf => {
+    const v = new DataView(buf);
+    const magic = String.fromCharCode(...new Uint8Array(buf, 0, 8));
+    if (magic !== 'LOOKUP02') throw new Error(indexUrl + ': not a lookup index (or an older format)');
+    const u = i => v.getUint32(8 + 4 * i, true);
+    const nStopPrinters = u(2), nStop = nStopPrinters + u(3);
+    const stop = new Uint32Array(buf, HEAD, nStop);
+    const flags = new Uint16Array(buf, HEAD + 4 * nStop);
+    return {
+      nDocs: u(0), nShards: u(4), block: u(5), topPrinters: u(6),
+      minScore: v.getFloat64(36, true), lengthWeight: v.getFloat64(44, true),
+      stops: [new Set(stop.subarray(0, nStopPrinters)), new Set(stop.subarray(nStopPrinters))],
+      lens: flags.map(f => f & ~PRINTER),          // trigram count by doc id
+      kinds: Uint8Array.from(flags, f => f < PRINTER ? 1 : 0),  // 0 printer, 1 cartridge
+    };
+  });
+  const shards = new Map(), blocks = new Map();
+
+  function shard(n) {
+    if (!shards.has(n)) shards.set(n, file('t-' + n + '.bin').then(buf => {
+      const a = new Uint32Array(buf), count = a[0];
+      return {codes: a.subarray(1, 1 + count), ends: a.subarray(1 + count, 1 + 2 * count), ids: a.subarray(1 + 2 * count)};
+    }));
+    return shards.get(n);
+  }
+
+  function postings(s, code) {
+    let lo = 0, hi = s.codes.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (s.codes[mid] < code) lo = mid + 1; else hi = mid;
+    }
+    if (s.codes[lo] !== code) return [];
+    return s.ids.subarray(lo ? s.ends[lo - 1] : 0, s.ends[lo]);
+  }
+
+  async function doc(i) {
+    const m = await meta, n = Math.floor(i / m.block);
+    if (!blocks.has(n)) blocks.set(n, file('d-' + n + '.json').then(buf => JSON.parse(new TextDecoder().decode(buf))));
+    return (await blocks.get(n))[i % m.block];
+  }
+
+  // "  envy " -> "  e", " en", "env", "nvy", "vy ": space 0, digits 1-10, letters 11-36
+  const charCode = c => c === 32 ? 0 : c < 97 ? c - 47 : c - 86;
+  function trigrams(words, prefix) {
+    const codes = new Set();
+    words.forEach((word, i) => {
+      const s = '  ' + word + (!prefix || i < words.length - 1 ? ' ' : '');
+      for (let j = 0; j + 2 < s.length; j++)
+        codes.add((charCode(s.charCodeAt(j)) * 37 + charCode(s.charCodeAt(j + 1))) * 37 + charCode(s.charCodeAt(j + 2)));
+    });
+    return codes;
+  }
+  const lookupWords = text => (text || '').toLowerCase().match(/[a-z0-9]+/g) || [];
+
+  // Top k cartridges for query -> [{name, url, words, score, via}], best first: by whole query
+  // words matched ("63" in "HP 63XL"), then by trigram score
+  async function search(query, k) {
+    const m = await meta;
+    const words = lookupWords(query);
+    const wordCodes = words.map((w, i) => trigrams([w], i === words.length - 1));
+    const codes = new Set(wordCodes.flatMap(c => [...c]));
+    if (!codes.size) return [];
+    const loaded = new Map();
+    await Promise.all([...new Set([...codes].map(c => c % m.nShards))].map(async n => loaded.set(n, await shard(n))));
+    const list = code => postings(loaded.get(code % m.nShards), code);
+    const counts = new Uint16Array(m.nDocs), seen = [];
+    for (const code of codes)
+      for (const id of list(code)) if (counts[id]++ === 0) seen.push(id);
+    const nByKind = m.stops.map(stop => [...codes].filter(c => !stop.has(c)).length);  // printers, cartridges
+    if (!nByKind[0] && !nByKind[1]) return [];
+    const need = Math.max(1, Math.ceil(m.minScore * Math.min(...nByKind.filter(n => n))));
+
+    // whole words; a word made only of a kind's stop trigrams counts for every doc of that kind
+    const matched = new Uint8Array(m.nDocs), base = [0, 0], wordHits = new Uint16Array(m.nDocs);
+    for (const wcodes of wordCodes) {
+      const full = m.stops.map(stop => [...wcodes].filter(c => !stop.has(c)).length);
+      full.forEach((n, kind) => { if (!n) base[kind]++; });
+      const touched = [];
+      for (const code of wcodes)
+        for (const id of list(code)) if (wordHits[id]++ === 0) touched.push(id);
+      for (const id of touched) {
+        if (wordHits[id] === full[m.kinds[id]]) matched[id]++;
+        wordHits[id] = 0;
+      }
+    }
+
+    const ranks = new Map();  // id -> [words, score]
+    for (const id of seen) {
+      const h = counts[id];
+      if (h < need) continue;
+      const kind = m.kinds[id];
+      const score = h / (nByKind[kind] + (m.lens[id] - h) * m.lengthWeight);
+      const nWords = matched[id] + base[kind];
+      if (score >= m.minScore || nWords === words.length) ranks.set(id, [nWords, score]);
+    }
+
+    const better = (a, b) => a[0] - b[0] || a[1] - b[1];  // > 0: rank a beats rank b
+    const byRank = (a, b) => better(b[1], a[1]) || a[0] - b[0];
+    const best = new Map([...ranks].filter(([id]) => m.kinds[id])), via = new Map();
+    const printers = [...ranks].filter(([id]) => !m.kinds[id]).sort(byRank).slice(0, m.topPrinters);
+    for (const [printer, rank] of printers)
+      for (const id of (await doc(printer))[2])
+        if (better(rank, best.get(id) || [0, 0]) > 0) { best.set(id, rank); via.set(id, printer); }
+    const top = [...best].sort(byRank).slice(0, k || 10);
+    return Promise.all(top.map(async ([id, [nWords, score]]) => {
+      const [name, path] = await doc(id);
+      return {name, url: siteUrl + '/' + path + '/', words: nWords, score: Math.round(score * 1e4) / 1e4,
+              via: via.has(id) ? (await doc(via.get(id)))[0] : null};
+    }));
+  }
+
+  return {search, ready: meta};
+}
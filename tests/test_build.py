@@ -0,0 +1,146 @@
+"""Incremental builds on a small catalog: manifest skips, the slug registry, validation, --check."""
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate  # noqa: E402
+
+COLUMNS = ["product_name", "model_number", "price", "page_yield", "compatible_models", "affiliate_url"]
+ROWS = [
+    ["HP 63 Black Ink Cartridge", "F6U62AN", "17.99", "190", "HP ENVY 4520; HP DeskJet 2130", ""],
+    ["HP 63XL Black Ink Cartridge", "F6U64AN", "42.99", "480", "HP ENVY 4520; HP DeskJet 2130", ""],
+    ["Brother TN760 Toner", "TN760", "69.99", "3000", "Brother HL-L2350DW", ""],
+    ["Epson T252XL Black", "T252/XL", "29.99", "1100", "Epson WorkForce WF-3620", ""],
+    ["Epson T252XL Black (value pack)", "T252.XL", "54.99", "2200", "Epson WorkForce WF-3620", ""],
+]
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)  # templates are found relative to the repo
+    data = tmp_path / "ink.csv"
+    write_csv(data, ROWS)
+    builder = generate.SiteBuilder(
+        OUTPUT_DIR=str(tmp_path / "docs"), BASE_URL="", state_dir=str(tmp_path / "state"),
+        AFFILIATE_OFFERS_CSV=str(tmp_path / "offers.csv"),
+        CATALOGS=[{"section": "ink", "csv": str(data), "template": "page_template.html"}],
+    )
+    return builder, data, tmp_path
+
+
+def page(tmp_path, slug):
+    return tmp_path / "docs" / "ink" / slug / "index.html"
+
+
+def test_unchanged_build_writes_nothing(site):
+    builder, _data, _tmp = site
+    first = builder.build()
+    assert first["pages"]["rendered"] == len(ROWS)
+    again = builder.build()
+    assert again["pages"]["skipped"] == len(ROWS) and again["pages"]["rendered"] == 0
+    assert again["written"]["written"] == 0
+
+
+def test_edited_and_removed_rows(site):
+    builder, data, tmp = site
+    builder.build()
+    before = page(tmp, "t252-xl").read_text(encoding="utf-8")
+    # a new price re-renders that page only: its neighbours list titles, not prices
+    write_csv(data, [ROWS[0][:2] + ["18.49"] + ROWS[0][3:]] + ROWS[1:2] + ROWS[3:])
+    summary = builder.build()
+    assert summary["pages"]["rendered"] == 1 and summary["pages"]["removed"] == 1
+    assert "18.49" in page(tmp, "f6u62an").read_text(encoding="utf-8")
+    assert page(tmp, "t252-xl").read_text(encoding="utf-8") == before
+    assert not page(tmp, "tn760").exists()
+
+
+def test_colliding_skus_keep_their_slugs(site):
+    builder, data, tmp = site
+    builder.build()
+    assert page(tmp, "t252-xl").exists() and page(tmp, "t252-xl-2").exists()
+    assert "value pack" in page(tmp, "t252-xl-2").read_text(encoding="utf-8")
+    # a new row order must not swap the published URLs
+    write_csv(data, [ROWS[4]] + ROWS[:4])
+    builder.build()
+    assert "value pack" in page(tmp, "t252-xl-2").read_text(encoding="utf-8")
+    with open(tmp / "state" / "slug-registry.json", encoding="utf-8") as f:
+        registry = json.load(f)["sections"]["ink"]
+    assert registry["sku:T252/XL"] == "t252-xl" and registry["sku:T252.XL"] == "t252-xl-2"
+
+
+def test_slug_registry_numbers_pages_for_good():
+    registry = generate.SlugRegistry()
+    first = registry.assign({"model_number": "TN-227BK"})
+    second = registry.assign({"model_number": "tn-227bk"})  # same SKU, any case: same page
+    assert first == second == "tn-227bk"
+    other = registry.assign({"model_number": "TN.227BK"})
+    assert other == "tn-227bk-2" and registry.collisions == 1
+    reloaded = generate.SlugRegistry(registry.by_key)
+    assert reloaded.ids() == {"tn-227bk": 0, "tn-227bk-2": 1}
+    assert reloaded.assign({"model_number": "TN.227BK"}) == "tn-227bk-2"
+
+
+def test_validation_reports_bad_rows(site):
+    builder, data, tmp = site
+    write_csv(data, ROWS + [
+        ["", "X1", "9.99", "100", "", ""],
+        ["Broken Price", "X2", "cheap", "100", "", ""],
+        ["Negative Yield", "X3", "9.99", "-5", "", ""],
+        ["HP 63 Black Ink Cartridge", "F6U62AN", "17.99", "190", "", ""],
+    ])
+    (report,) = builder.validate()
+    issues = report["issues"]
+    assert issues["missing_name"]["count"] == 1
+    assert issues["bad_price"]["count"] == 1
+    assert issues["bad_page_yield"]["count"] == 1
+    assert issues["duplicate_sku"]["level"] == "warning"
+    assert issues["slug_collision"]["count"] == 1
+    with pytest.raises(SystemExit):
+        builder.build(strict=True)
+    assert not (tmp / "docs" / "ink").exists()  # nothing rendered before the catalog is valid
+
+
+def test_check_counts_pending_changes(site, monkeypatch):
+    builder, data, tmp = site
+    assert builder.check() == len(ROWS)  # nothing built yet: every page is new
+    builder.build()
+    assert builder.check() == 0
+    write_csv(data, [ROWS[0][:2] + ["18.49"] + ROWS[0][3:]] + ROWS[1:2] + ROWS[3:])
+    assert builder.check() == 2  # one page to re-render, one removed
+    assert page(tmp, "tn760").exists()  # --check writes and removes nothing
+    for name, value in builder.config.items():  # the CLI's site takes the module's settings
+        monkeypatch.setattr(generate, name, value)
+    with pytest.raises(SystemExit) as exit_code:
+        generate.main(["--check", "--log-level", "WARNING"])
+    assert exit_code.value.code == 1
+
+
+def test_sites_build_at_the_same_time(site):
+    _builder, data, tmp = site
+    builders = [
+        generate.SiteBuilder(OUTPUT_DIR=str(tmp / name), BASE_URL=f"https://{name}.example",
+                             state_dir=str(tmp / f"{name}-state"), AFFILIATE_OFFERS_CSV=str(tmp / "offers.csv"),
+                             CATALOGS=[{"section": "ink", "csv": str(data), "template": "page_template.html"}])
+        for name in ("one", "two")
+    ]
+    with ThreadPoolExecutor(2) as pool:
+        summaries = list(pool.map(lambda b: b.build(), builders))
+    assert [s["pages"]["rendered"] for s in summaries] == [len(ROWS)] * 2
+    for name, other in (("one", "two"), ("two", "one")):
+        html = (tmp / name / "ink" / "tn760" / "index.html").read_text(encoding="utf-8")
+        assert f"https://{name}.example/ink/tn760/" in html and f"{other}.example" not in html
+    assert generate.OUTPUT_DIR == "docs" and generate.BASE_URL != "https://one.example"
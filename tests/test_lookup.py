@@ -0,0 +1,80 @@
+"""FuzzyLookup ranking on the shipped data, and parity with templates/partials/lookup.js."""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate  # noqa: E402
+
+QUERIES = [
+    "hp 63", "hp 63xl", "63", "envy 4520", "hp envy", "canon 245", "pg-245xl", "tn760", "lc47",
+    "workfroce 3620", "brother hl", "epson ecotank", "hp", "ink", "x", "", "!!", "offic",
+]
+
+NODE_SEARCH = """
+const fs = require('fs');
+eval(fs.readFileSync(process.argv[1], 'utf8') + ';globalThis.createLookup = createLookup');
+const L = createLookup(process.argv[2], '', url => Promise.resolve(new Uint8Array(fs.readFileSync(url)).buffer));
+(async () => {
+  const out = [];
+  for (const q of JSON.parse(process.argv[3])) out.push(await L.search(q, 10));
+  console.log(JSON.stringify(out));
+})();
+"""
+
+
+@pytest.fixture(scope="module")
+def site(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("site")
+    cwd = os.getcwd()
+    os.chdir(ROOT)  # the default CSV and template paths are relative to the repo
+    try:
+        builder = generate.SiteBuilder(OUTPUT_DIR=str(tmp / "docs"), BASE_URL="", state_dir=str(tmp / "state"))
+        builder.build()
+        yield builder, str(tmp / "docs" / generate.LOOKUP_DIR)
+    finally:
+        os.chdir(cwd)
+
+
+def test_model_number_beats_printer_name(site):
+    builder, _index = site
+    hits = builder.lookup("hp 63", 4)
+    assert [h["name"] for h in hits] == [
+        "HP 63 Black Ink Cartridge", "HP 63 Tri-Color Ink Cartridge",
+        "HP 63XL Black Ink Cartridge", "HP 63XL Tri-Color Ink Cartridge",
+    ]
+    assert all(h["words"] == 2 and h["via"] is None for h in hits)
+
+
+def test_bare_model_number_finds_its_cartridges(site):
+    builder, _index = site
+    assert {h["name"] for h in builder.lookup("63")} == {
+        "HP 63 Black Ink Cartridge", "HP 63 Tri-Color Ink Cartridge",
+        "HP 63XL Black Ink Cartridge", "HP 63XL Tri-Color Ink Cartridge",
+    }
+
+
+def test_printer_name_ranks_its_cartridges(site):
+    builder, _index = site
+    hits = builder.lookup("envy 4520", 4)
+    assert {h["via"] for h in hits} == {"HP ENVY 4520"}
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_python_and_js_rank_alike(site):
+    builder, index = site
+    js = subprocess.run(
+        ["node", "-e", NODE_SEARCH, os.path.join(ROOT, "templates", "partials", "lookup.js"), index,
+         json.dumps(QUERIES)],
+        capture_output=True, text=True, check=True,
+    )
+    for query, js_hits in zip(QUERIES, json.loads(js.stdout)):
+        py_hits = builder.lookup(query, 10)
+        assert [dict(h, score=None) for h in py_hits] == [dict(h, score=None) for h in js_hits], query
+        assert [h["score"] for h in py_hits] == pytest.approx([h["score"] for h in js_hits], abs=1e-4), query